@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+
+"""Сравнение скорости кодирования и декодирования пакетов."""
+
+from ctypes import POINTER, cast, create_string_buffer
+from random import randbytes
+from timeit import timeit
+
+from smsd.client import SmsdUsbClient
+from smsd.core import FrameEncoder, FrameSplitter, SmsdConnection, parse
+from smsd.protocol import CMD_TYPE, COMMAND, COMMANDS_RETURN_DATA_TYPE, LAN_COMMAND_TYPE
+from smsd.smsd import Smsd
+
+NUMBER = 100000
+STREAM_FRAMES = 1000
+
+
+class BenchSmsd(Smsd):
+    """Клиент без транспорта для измерений."""
+
+    def _bus_exchange(self, packet: bytes) -> bytes:
+        return b"\x00\x01"
+
+
+def legacy_parse_answer(buffer: bytes) -> COMMANDS_RETURN_DATA_TYPE:
+    """Прежний способ расшифровки ответа через create_string_buffer и cast."""
+
+    lan_command_type = cast(create_string_buffer(buffer), POINTER(LAN_COMMAND_TYPE)).contents
+    xor = Smsd._checksum([lan_command_type.VER,
+                          lan_command_type.TYPE,
+                          lan_command_type.ID,
+                          lan_command_type.LENGTH & 0xFF,
+                          lan_command_type.LENGTH >> 8,
+                         *lan_command_type.DATA[:lan_command_type.LENGTH]])
+    if xor != lan_command_type.XOR:
+        raise ValueError
+    ret_data = create_string_buffer(bytes(lan_command_type.DATA[:lan_command_type.LENGTH]))
+    return cast(ret_data, POINTER(COMMANDS_RETURN_DATA_TYPE)).contents
+
+
+def report(name: str, seconds: float) -> None:
+    print(f"{name:<24}{seconds / NUMBER * 1e6:8.2f} us")
+
+
+if __name__ == "__main__":
+    client = BenchSmsd()
+    answer = client._make_request(CMD_TYPE.CODE_CMD_RESPONSE,
+                                  bytes(COMMANDS_RETURN_DATA_TYPE(ERROR_OR_COMMAND=0x10,
+                                                                  RETURN_DATA=12345)))
+
+    assert legacy_parse_answer(answer).RETURN_DATA == \
+           client._parse_answer(answer, COMMANDS_RETURN_DATA_TYPE).RETURN_DATA
+
+    report("parse_answer (legacy)", timeit(lambda: legacy_parse_answer(answer), number=NUMBER))
+    report("parse_answer", timeit(lambda: client._parse_answer(answer, COMMANDS_RETURN_DATA_TYPE),
+                                  number=NUMBER))
+
+    encoder = FrameEncoder(1)
+    report("core powerstep01", timeit(lambda: encoder.powerstep01(COMMAND.CMD_POWERSTEP01_MOVE_F,
+                                                                  1000), number=NUMBER))
+    report("core parse", timeit(lambda: parse(answer, COMMANDS_RETURN_DATA_TYPE), number=NUMBER))
+
+    # поток ответов, разрезанный на части по 1460 байтов (MSS для Ethernet)
+    stream = answer * STREAM_FRAMES
+    chunks = [stream[offset:offset + 1460] for offset in range(0, len(stream), 1460)]
+    splitter = FrameSplitter()
+    assert sum(len(splitter.feed(chunk)) for chunk in chunks) == STREAM_FRAMES
+    report("core split", timeit(lambda: [splitter.feed(chunk) for chunk in chunks],
+                                number=NUMBER // STREAM_FRAMES))
+
+    def roundtrip() -> None:
+        connection = SmsdConnection(1)
+        for _ in range(STREAM_FRAMES // 100):
+            requests = [connection.send_powerstep01(COMMAND.CMD_POWERSTEP01_GET_ABS_POS)[1]
+                        for _ in range(100)]
+            replies = b"".join(request[:4] + answer[4:] for request in requests)
+            connection.receive(replies)
+
+    report("core roundtrip", timeit(roundtrip, number=NUMBER // STREAM_FRAMES))
+
+    frame = randbytes(1030)
+    escaped = SmsdUsbClient._escape(frame)
+    report("escape 1 KB", timeit(lambda: SmsdUsbClient._escape(frame), number=NUMBER))
+    report("unescape 1 KB", timeit(lambda: SmsdUsbClient._unescape(escaped), number=NUMBER))
@@ -3,7 +3,6 @@
 """Проверка работы всех функций."""
 
 import logging
-from time import sleep
 
 from smsd.client import SmsdTcpClient, SmsdUsbClient
 
@@ -14,7 +13,8 @@ if __name__ == "__main__":
     client = SmsdTcpClient(address="192.168.1.2", port=5000, timeout=1.0)
     # client = SmsdUsbClient(address="COM7", timeout=1.0)
 
-    # sleep(2)  # Без паузы при работе через USB при первом включении возвращается ошибка ERROR_ACCESS_TIMEOUT
+    # При работе через USB сразу после первого включения без паузы около 2 с
+    # возвращается ошибка ERROR_ACCESS_TIMEOUT
 
     print(f"authorization: {client.authorization()}")
     # print(f"set_password: {client.set_password('12345678')}")
@@ -73,48 +73,33 @@ if __name__ == "__main__":
     print(f"    program_n: {mode.PROGRAM_N}")
 
     # print(f"run_f: {client.run_f(500)}")
-    # sleep(5)
     # print(f"run_f: {client.run_r(500)}")
-    # sleep(5)
 
     print(f"move_f: {client.move_f(5000)}")
-    sleep(5)
+    print(f"wait_until_idle: {client.wait_until_idle(timeout=10)}")
     print(f"move_r: {client.move_r(5000)}")
-    sleep(5)
+    print(f"wait_until_idle: {client.wait_until_idle(timeout=10)}")
 
     # print(f"go_to_f: {client.go_to_f(500)}")
-    # sleep(5)
     # print(f"go_to_r: {client.go_to_r(0)}")
-    # sleep(5)
 
     # print(f"go_until_f: {client.go_until_f(0)}")
-    # sleep(5)
     # print(f"go_until_r: {client.go_until_r(0)}")
-    # sleep(5)
 
     # print(f"scan_zero_f: {client.scan_zero_f(500)}")
-    # sleep(5)
     # print(f"scan_zero_r: {client.scan_zero_r(500)}")
-    # sleep(5)
 
     # print(f"scan_label_f: {client.scan_label_f(500)}")
-    # sleep(5)
     # print(f"scan_label_r: {client.scan_label_r(500)}")
-    # sleep(5)
 
     # print(f"scan_mark_f: {client.scan_mark2_f(500)}")
-    # sleep(5)
     # print(f"scan_mark_r: {client.scan_mark2_r(500)}")
-    # sleep(5)
 
     # print(f"go_zero: {client.go_zero()}")
-    # sleep(5)
 
     # print(f"go_label: {client.go_label()}")
-    # sleep(5)
 
     # print(f"go_label: {client.go_to(1000)}")
-    # sleep(5)
 
     print(f"get_abs_pos: {client.get_abs_pos()}")
     print(f"get_el_pos: {client.get_el_pos()}")
@@ -0,0 +1,219 @@
+#! /usr/bin/env python3
+
+"""Имитатор контроллера SMSD-LAN для проверки клиентов без оборудования."""
+
+import asyncio
+import logging
+from ctypes import sizeof
+from struct import Struct
+from time import monotonic
+
+from smsd.motion import MotionProfile
+from smsd.protocol import (
+    CMD_TYPE,
+    COMMAND,
+    COMMANDS_RETURN_DATA_TYPE,
+    ERROR_OR_COMMAND,
+    LAN_ERROR_STATISTICS,
+    SMSD_LAN_CONFIG_TYPE,
+)
+
+HEADER = Struct("<BBBBH")
+VERSION = 1
+
+GETTERS = {
+    COMMAND.CMD_POWERSTEP01_GET_SPEED: ERROR_OR_COMMAND.COMMAND_GET_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MIN_SPEED: ERROR_OR_COMMAND.COMMAND_GET_MIN_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MAX_SPEED: ERROR_OR_COMMAND.COMMAND_GET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MODE: ERROR_OR_COMMAND.COMMAND_GET_MODE,
+    COMMAND.CMD_POWERSTEP01_GET_ABS_POS: ERROR_OR_COMMAND.COMMAND_GET_ABS_POS,
+    COMMAND.CMD_POWERSTEP01_GET_EL_POS: ERROR_OR_COMMAND.COMMAND_GET_EL_POS,
+    COMMAND.CMD_POWERSTEP01_STATUS_IN_EVENT: ERROR_OR_COMMAND.COMMAND_GET_STATUS_IN_EVENT,
+    COMMAND.CMD_POWERSTEP01_GET_STACK: ERROR_OR_COMMAND.COMMAND_GET_STACK,
+}
+
+SETTERS = {
+    COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED: COMMAND.CMD_POWERSTEP01_GET_MIN_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED: COMMAND.CMD_POWERSTEP01_GET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_MODE: COMMAND.CMD_POWERSTEP01_GET_MODE,
+}
+
+
+def make_frame(cmd_type: int, cmd_id: int, data: bytes) -> bytes:
+    """Формирование пакета с контрольной суммой."""
+
+    frame = bytearray(HEADER.pack(0, VERSION, cmd_type, cmd_id, len(data)) + data)
+    frame[0] = -sum(frame[1:]) & 0xFF
+    return bytes(frame)
+
+
+class FakeController:
+    """Состояние имитируемого контроллера."""
+
+    def __init__(self, delay: float = 0.0) -> None:
+        self.delay = delay
+        self.values = dict.fromkeys(GETTERS, 0)
+        self.relay = False
+        self.motion: tuple[float, float, int, int] | None = None  # начало, длительность, откуда, куда
+        self.profile = MotionProfile()
+        self.banks: dict[int, bytes] = {}
+        self.uploads: dict[int, bytes] = {}
+        self.downloads: dict[int, bytes] = {}
+        self.config = SMSD_LAN_CONFIG_TYPE(MAC=(0, 8, 220, 1, 2, 3), IP=(127, 0, 0, 1),
+                                           SN=(255, 0, 0, 0), PORT=5000)
+
+    def powerstep01(self, word: int) -> COMMANDS_RETURN_DATA_TYPE:
+        """Выполнение команды POWERSTEP01."""
+
+        command, value = word >> 4 & 0x3F, word >> 10
+        result = COMMANDS_RETURN_DATA_TYPE(BUSY=1)
+        position = self.position()
+        if self.motion is not None:
+            result.BUSY, result.MOT_STATUS = 0, 3
+
+        if command == COMMAND.CMD_POWERSTEP01_GET_ABS_POS:
+            result.ERROR_OR_COMMAND = ERROR_OR_COMMAND.COMMAND_GET_ABS_POS
+            result.RETURN_DATA = position & 0x3FFFFF
+        elif command in GETTERS:
+            result.ERROR_OR_COMMAND = GETTERS[command]
+            result.RETURN_DATA = self.values[command]
+        elif command in SETTERS:
+            self.values[SETTERS[command]] = value
+            if command == COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED:
+                self.profile = self.profile._replace(max_speed=value)
+            elif command == COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED:
+                self.profile = self.profile._replace(min_speed=value)
+        elif command == COMMAND.CMD_POWERSTEP01_SET_ACC:
+            self.profile = self.profile._replace(acc=value)
+        elif command == COMMAND.CMD_POWERSTEP01_SET_DEC:
+            self.profile = self.profile._replace(dec=value)
+        elif command == COMMAND.CMD_POWERSTEP01_MOVE_F:
+            self.move(position + value)
+        elif command == COMMAND.CMD_POWERSTEP01_MOVE_R:
+            self.move(position - value)
+        elif command in (COMMAND.CMD_POWERSTEP01_GO_TO, COMMAND.CMD_POWERSTEP01_GO_TO_F,
+                         COMMAND.CMD_POWERSTEP01_GO_TO_R):
+            self.move(value - 0x400000 if value & 0x200000 else value)
+        elif command in (COMMAND.CMD_POWERSTEP01_HARD_STOP, COMMAND.CMD_POWERSTEP01_SOFT_STOP):
+            self.motion = None
+            self.values[COMMAND.CMD_POWERSTEP01_GET_ABS_POS] = position
+        elif command == COMMAND.CMD_POWERSTEP01_RESET_POS:
+            self.motion = None
+            self.values[COMMAND.CMD_POWERSTEP01_GET_ABS_POS] = 0
+        elif command in (COMMAND.CMD_POWERSTEP01_SET_RELE, COMMAND.CMD_POWERSTEP01_CLR_RELE):
+            self.relay = command == COMMAND.CMD_POWERSTEP01_SET_RELE
+            result.ERROR_OR_COMMAND = ERROR_OR_COMMAND.STATUS_RELE_SET if self.relay else \
+                                      ERROR_OR_COMMAND.STATUS_RELE_CLR
+        elif command == COMMAND.CMD_POWERSTEP01_GET_RELE:
+            result.ERROR_OR_COMMAND = ERROR_OR_COMMAND.STATUS_RELE_SET if self.relay else \
+                                      ERROR_OR_COMMAND.STATUS_RELE_CLR
+        elif command in (COMMAND.CMD_POWERSTEP01_END, COMMAND.CMD_POWERSTEP01_STOP_USB):
+            result.ERROR_OR_COMMAND = ERROR_OR_COMMAND.END_PROGRAMS
+
+        return result
+
+    def position(self) -> int:
+        """Текущее положение с учётом выполняемого перемещения."""
+
+        if self.motion is None:
+            return self.values[COMMAND.CMD_POWERSTEP01_GET_ABS_POS]
+
+        start, duration, origin, target = self.motion
+        elapsed = monotonic() - start
+        if elapsed >= duration:
+            self.motion = None
+            self.values[COMMAND.CMD_POWERSTEP01_GET_ABS_POS] = target
+            return target
+        return origin + round((target - origin) * elapsed / duration)
+
+    def move(self, target: int) -> None:
+        """Начало перемещения в положение target (скорость изменяется
+        равномерно, длительность - по профилю скорости).
+        """
+
+        origin = self.position()
+        duration = self.profile.move_time(target - origin)
+        self.values[COMMAND.CMD_POWERSTEP01_GET_ABS_POS] = target
+        self.motion = (monotonic(), duration, origin, target) if duration else None
+
+    def handle(self, cmd_type: int, data: bytes) -> bytes:
+        """Обработка команды и формирование поля данных ответа."""
+
+        if cmd_type == CMD_TYPE.CODE_CMD_REQUEST:
+            return bytes(COMMANDS_RETURN_DATA_TYPE(ERROR_OR_COMMAND=ERROR_OR_COMMAND.OK_ACCESS))
+        if cmd_type == CMD_TYPE.CODE_CMD_POWERSTEP01:
+            return bytes(self.powerstep01(int.from_bytes(data[:4], "little")))
+        if cmd_type == CMD_TYPE.CODE_CMD_CONFIG_GET:
+            return bytes(self.config)
+        if cmd_type == CMD_TYPE.CODE_CMD_CONFIG_SET:
+            self.config = SMSD_LAN_CONFIG_TYPE.from_buffer_copy(data[:sizeof(SMSD_LAN_CONFIG_TYPE)])
+        elif cmd_type == CMD_TYPE.CODE_CMD_ERROR_GET:
+            return bytes(LAN_ERROR_STATISTICS(N_STARTS=1))
+        elif CMD_TYPE.CODE_CMD_POWERSTEP01_W_MEM0 <= cmd_type <= CMD_TYPE.CODE_CMD_POWERSTEP01_W_MEM3:
+            return self.write_bank(cmd_type - CMD_TYPE.CODE_CMD_POWERSTEP01_W_MEM0, data)
+        elif CMD_TYPE.CODE_CMD_POWERSTEP01_R_MEM0 <= cmd_type <= CMD_TYPE.CODE_CMD_POWERSTEP01_R_MEM3:
+            return self.read_bank(cmd_type - CMD_TYPE.CODE_CMD_POWERSTEP01_R_MEM0)
+        return bytes(COMMANDS_RETURN_DATA_TYPE())
+
+    def write_bank(self, bank: int, data: bytes) -> bytes:
+        """Приём очередного пакета программы."""
+
+        image = self.uploads.pop(bank, b"") + data
+        last = int.from_bytes(data[-4:], "little")
+        if len(data) < 1024 or last >> 4 & 0x3F == COMMAND.CMD_POWERSTEP01_END:
+            self.banks[bank] = image
+            return bytes(COMMANDS_RETURN_DATA_TYPE(ERROR_OR_COMMAND=ERROR_OR_COMMAND.END_PROGRAMS))
+
+        self.uploads[bank] = image
+        return bytes(COMMANDS_RETURN_DATA_TYPE(ERROR_OR_COMMAND=ERROR_OR_COMMAND.NO_NEXT))
+
+    def read_bank(self, bank: int) -> bytes:
+        """Выдача очередного пакета программы."""
+
+        image = self.downloads.pop(bank, None)
+        if image is None:
+            image = self.banks.get(bank, bytes(4))
+        if len(image) > 1024:
+            self.downloads[bank] = image[1024:]
+        return image[:1024]
+
+    async def serve_client(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter) -> None:
+        """Обслуживание одного соединения."""
+
+        loop = asyncio.get_running_loop()
+        writer.write(make_frame(CMD_TYPE.CODE_CMD_RESPONSE, 0, b""))
+        try:
+            while True:
+                header = await reader.readexactly(HEADER.size)
+                _, _, cmd_type, cmd_id, length = HEADER.unpack(header)
+                data = await reader.readexactly(length)
+                answer = make_frame(CMD_TYPE.CODE_CMD_RESPONSE, cmd_id,
+                                    self.handle(cmd_type, data))
+                if self.delay:      # задержка сети, ответы не ждут друг друга
+                    loop.call_later(self.delay, writer.write, answer)
+                else:
+                    writer.write(answer)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host: str = "127.0.0.1", port: int = 5000,
+                delay: float = 0.0) -> asyncio.base_events.Server:
+    """Запуск имитатора на указанном адресе."""
+
+    controller = FakeController(delay)
+    return await asyncio.start_server(controller.serve_client, host, port)
+
+
+async def main() -> None:
+    server = await serve()
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+#! /usr/bin/env python3
+
+"""Реализация асинхронного клиента для управления контроллером SMSD-LAN."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from types import TracebackType
+
+from .core import SmsdConnection
+from .smsd import AsyncSmsd, SmsdConnectionError, SmsdError
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+
+class SmsdProtocol(asyncio.Protocol):
+    """Протокол asyncio: выделение пакетов из потока и передача их
+    ожидающим запросам по полю ID. Сопоставление ответов с запросами
+    выполняет SmsdConnection; greeting получает версию протокола из
+    пакета, который устройство присылает при подключении.
+    """
+
+    def __init__(self) -> None:
+        """Инициализация протокола."""
+
+        self.transport: asyncio.Transport | None = None
+        self.greeting: asyncio.Future[int] = asyncio.get_running_loop().create_future()
+        self.waiters: dict[int, asyncio.Future[bytes]] = {}
+        self.connection = SmsdConnection()
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport      # type: ignore
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        error = SmsdConnectionError("Connection closed")
+        waiters: list[asyncio.Future] = [self.greeting, *self.waiters.values()]
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(error)
+        self.waiters.clear()
+
+    def data_received(self, data: bytes) -> None:
+        greeting = self.connection.greeting
+        try:
+            answers = self.connection.receive(data)
+        except SmsdError:
+            self.transport.close()      # type: ignore
+            return
+
+        if greeting and not self.connection.greeting and not self.greeting.done():
+            self.greeting.set_result(self.connection.encoder.version)
+        for cmd_id, frame in answers:
+            self._dispatch(cmd_id, frame)
+
+    def _dispatch(self, cmd_id: int, frame: bytes) -> None:
+        """Передача пакета ожидающему запросу."""
+
+        waiter = self.waiters.pop(cmd_id, None)
+        if waiter is None or waiter.done():
+            _logger.debug("Skip frame with ID %d", cmd_id)
+            return
+        waiter.set_result(frame)
+
+
+class AsyncSmsdTcpClient(AsyncSmsd):
+    """Класс асинхронного клиента для управления SMSD-LAN по протоколу TCP.
+    Создаётся сопрограммой connect, допускает одновременное выполнение
+    нескольких команд.
+    """
+
+    def __init__(self, transport: asyncio.Transport, protocol: SmsdProtocol,
+                       version: int, timeout: float = 1.0) -> None:
+        """Инициализация класса клиента для установленного соединения."""
+
+        self.transport = transport
+        self.protocol = protocol
+        self.timeout = timeout
+        super().__init__(version)
+
+    @classmethod
+    async def connect(cls, address: str, port: int = 5000,
+                           timeout: float = 1.0) -> AsyncSmsdTcpClient:
+        """Установка соединения с устройством и получение версии протокола."""
+
+        loop = asyncio.get_running_loop()
+        transport, protocol = await asyncio.wait_for(
+                                loop.create_connection(SmsdProtocol, address, port), timeout)
+        try:
+            version = await asyncio.wait_for(protocol.greeting, timeout)
+        except BaseException:
+            transport.close()
+            raise
+
+        return cls(transport, protocol, version, timeout)
+
+    async def close(self) -> None:
+        """Закрытие соединения с устройством."""
+
+        self.transport.close()
+
+    async def __aenter__(self) -> AsyncSmsdTcpClient:
+        return self
+
+    async def __aexit__(self, exc_type: type[BaseException] | None,
+                              exc_value: BaseException | None,
+                              traceback: TracebackType | None) -> None:
+        await self.close()
+
+    async def get_version(self) -> int:                        # type: ignore
+        """Получение версии протокола, полученной при подключении."""
+
+        return self.protocol.greeting.result()
+
+    async def _bus_exchange(self, packet: bytes) -> bytes:     # type: ignore
+        """Обмен по интерфейсу. Ответ сопоставляется с запросом по полю ID."""
+
+        if self.transport.is_closing():
+            msg = "Connection closed"
+            raise SmsdConnectionError(msg)
+
+        waiters = self.protocol.waiters
+        cmd_id = packet[3]
+        while (previous := waiters.get(cmd_id)) is not None and not previous.done():
+            with suppress(Exception):
+                await asyncio.shield(previous)
+
+        self.protocol.connection.expect(packet)
+        waiter = asyncio.get_running_loop().create_future()
+        waiters[cmd_id] = waiter
+        self.transport.write(packet)
+
+        try:
+            return await asyncio.wait_for(waiter, self.timeout)
+        except asyncio.TimeoutError:
+            msg = "Response timeout"
+            raise SmsdError(msg) from None
+        finally:
+            if waiters.get(cmd_id) is waiter:
+                del waiters[cmd_id]
+                self.protocol.connection.pending.discard(cmd_id)
+
+
+__all__ = ["AsyncSmsdTcpClient", "SmsdProtocol"]
@@ -0,0 +1,127 @@
+#! /usr/bin/env python3
+
+"""Кэш программ управления, записанных в банки памяти контроллеров."""
+
+from __future__ import annotations
+
+import json
+import os
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from threading import Lock
+from typing import Iterable, Mapping
+
+from .smsd import Smsd, program_image
+
+
+def program_digest(program: Iterable[int] | bytes | bytearray | memoryview) -> str:
+    """Хэш SHA-256 образа программы (см. program_image)."""
+
+    return sha256(program_image(program)).hexdigest()
+
+
+class ProgramCache:
+    """Индекс программ, записанных в банки памяти контроллеров. Контроллер
+    определяется MAC-адресом из get_lan_config, для каждого банка хранится
+    хэш последнего записанного образа. Индекс сохраняется в файл JSON, если
+    указан путь. Банки, содержимое которых не изменилось, не записываются.
+    """
+
+    def __init__(self, path: str | os.PathLike[str] | None = None) -> None:
+        """Инициализация кэша и загрузка индекса из файла."""
+
+        self.path = path
+        self.index: dict[str, dict[str, str]] = {}
+        self._lock = Lock()
+        self._save_lock = Lock()    # порядок замены файла индекса
+        if path is not None and os.path.exists(path):
+            with open(path, encoding="utf-8") as file:
+                self.index = json.load(file)
+
+    def save(self) -> None:
+        """Сохранение индекса в файл. Файл заменяется целиком через
+        временный файл в том же каталоге, поэтому прерванная запись не портит
+        предыдущий индекс.
+        """
+
+        if self.path is None:
+            return
+
+        path = os.fspath(self.path)
+        with self._save_lock:
+            with self._lock:
+                data = json.dumps(self.index, indent=2, sort_keys=True)
+            with NamedTemporaryFile("w", encoding="utf-8", delete=False,
+                                    dir=os.path.dirname(path) or ".",
+                                    prefix=os.path.basename(path), suffix=".tmp") as file:
+                try:
+                    file.write(data)
+                    file.close()
+                    os.replace(file.name, path)
+                except BaseException:
+                    file.close()
+                    os.unlink(file.name)
+                    raise
+
+    @staticmethod
+    def key(client: Smsd) -> str:
+        """Ключ контроллера - MAC-адрес."""
+
+        return ":".join(f"{byte:02X}" for byte in client.get_lan_config().MAC)
+
+    def get(self, key: str, bank: int) -> str | None:
+        """Хэш программы, записанной в банк, или None."""
+
+        with self._lock:
+            return self.index.get(key, {}).get(str(bank))
+
+    def set(self, key: str, bank: int, digest: str | None) -> None:
+        """Запоминание хэша программы банка. None удаляет запись."""
+
+        with self._lock:
+            banks = self.index.setdefault(key, {})
+            if digest is None:
+                banks.pop(str(bank), None)
+            else:
+                banks[str(bank)] = digest
+
+    def verify(self, client: Smsd, bank: int, digest: str) -> bool:
+        """Сравнение программы, прочитанной из банка, с ожидаемым хэшем."""
+
+        return program_digest(client.read_program(bank)) == digest
+
+    def sync(self, client: Smsd,
+                   programs: Mapping[int, Iterable[int] | bytes | bytearray | memoryview],
+                   verify: bool = False) -> dict[int, bool]:
+        """Запись программ в банки памяти контроллера. Банк записывается,
+        только если хэш программы отличается от сохранённого в индексе;
+        при verify=True содержимое банка дополнительно сверяется чтением.
+        Возвращает словарь банк - признак записи.
+        """
+
+        key = self.key(client)
+        changed = {}
+        for bank, program in programs.items():
+            image = program_image(program)
+            digest = sha256(image).hexdigest()
+            cached = self.get(key, bank) == digest
+            if cached and verify:
+                cached = self.verify(client, bank, digest)
+            if not cached:
+                changed[bank] = (image, digest)
+
+        if changed:
+            # индекс сохраняется до записи: прерванная запись оставляет
+            # в банке неполную программу, которую нужно записать заново
+            for bank in changed:
+                self.set(key, bank, None)
+            self.save()
+            for bank, (image, digest) in changed.items():
+                client.write_program(bank, image)
+                self.set(key, bank, digest)
+            self.save()
+
+        return {bank: bank in changed for bank in programs}
+
+
+__all__ = ["ProgramCache", "program_digest"]
@@ -2,36 +2,145 @@
 
 """Реализация клиента для управления контроллером шагового двигателя SMSD-LAN."""
 
+from __future__ import annotations
+
 import logging
-from socket import AF_INET, SOCK_STREAM, socket
-from typing import Callable
+import socket as _socket
+from collections import deque
+from ctypes import Structure
+from socket import IPPROTO_TCP, SO_KEEPALIVE, SOL_SOCKET, create_connection, socket
+from socket import timeout as SocketTimeout
+from time import monotonic, sleep, time
+from typing import Callable, Iterable
 
 from serial import Serial
 
-from .smsd import Smsd, SmsdError
+from .core import FrameSplitter, SmsdConnection
+from .protocol import COMMAND, COMMANDS_RETURN_DATA_TYPE, ERROR_OR_COMMAND
+from .smsd import _READ_ONLY, Smsd, SmsdConnectionError, SmsdError
 
 _logger = logging.getLogger(__name__)
 _logger.addHandler(logging.NullHandler())
 
+_KEEPALIVE = (("TCP_KEEPIDLE", 10), ("TCP_KEEPINTVL", 5), ("TCP_KEEPCNT", 3))
+_ACCESS_TIMEOUT = 1.0       # пауза между повторными авторизациями
+_BACKOFF_MIN = 0.1
+_BACKOFF_MAX = 10.0
+
+_ERRORS = frozenset({
+    ERROR_OR_COMMAND.ERROR_ACCESS,
+    ERROR_OR_COMMAND.ERROR_ACCESS_TIMEOUT,
+    ERROR_OR_COMMAND.ERROR_XOR,
+    ERROR_OR_COMMAND.ERROR_NO_COMMAND,
+    ERROR_OR_COMMAND.ERROR_LEN,
+    ERROR_OR_COMMAND.ERROR_RANGE,
+    ERROR_OR_COMMAND.ERROR_WRITE,
+    ERROR_OR_COMMAND.ERROR_READ,
+    ERROR_OR_COMMAND.ERROR_PROGRAMS,
+    ERROR_OR_COMMAND.ERROR_WRITE_SETUP,
+})
+
+
+class FrameTracer:
+    """Кольцевой буфер последних отправленных и принятых пакетов."""
+
+    def __init__(self, size: int = 256) -> None:
+        """Инициализация буфера на заданное количество пакетов."""
+
+        self.frames: deque[tuple[float, str, bytes]] = deque(maxlen=size)
+
+    def record(self, direction: str, frame: bytes) -> None:
+        """Запись пакета в буфер."""
+
+        self.frames.append((time(), direction, bytes(frame)))
+
+    def clear(self) -> None:
+        """Очистка буфера."""
+
+        self.frames.clear()
+
+    def dump(self) -> str:
+        """Шестнадцатеричный дамп содержимого буфера."""
+
+        return "\n".join(f"{timestamp:.6f} {direction} {frame.hex(' ')}"
+                         for timestamp, direction, frame in tuple(self.frames))
+
+
+def _set_keepalive(sock: socket) -> None:
+    """Включение TCP keepalive с интервалами _KEEPALIVE, если они
+    поддерживаются платформой.
+    """
+
+    sock.setsockopt(SOL_SOCKET, SO_KEEPALIVE, 1)
+    for name, value in _KEEPALIVE:
+        if hasattr(_socket, name):
+            sock.setsockopt(IPPROTO_TCP, getattr(_socket, name), value)
+
+
+def _log_frame(client: SmsdUsbClient | SmsdTcpClient, direction: str, frame: bytes) -> None:
+    """Вывод отладочной информации и трассировка одного пакета."""
+
+    if _logger.isEnabledFor(logging.DEBUG):
+        _logger.debug("%s frame: %r", direction, list(frame))
+    if client.tracer is not None:
+        client.tracer.record(direction.lower(), frame)
+
 
 def log(func: Callable) -> Callable:
-    """Вывод отладочной информации."""
+    """Вывод отладочной информации и трассировка пакетов. Если отладочный
+    вывод выключен и трассировщик не установлен, пакеты не обрабатываются.
+    """
+
+    def wrapper(self: SmsdUsbClient | SmsdTcpClient, packet: bytes) -> bytes:
+        if self.tracer is None and not _logger.isEnabledFor(logging.DEBUG):
+            return func(self, packet)
 
-    def wrapper(self: Callable[[bytes], bytes], packet: bytes) -> bytes:
-        _logger.debug("Send frame: %r", list(packet))
+        _log_frame(self, "Send", packet)
         answer = func(self, packet)
-        _logger.debug("Recv frame: %r", list(answer))
-        return bytes(answer)
+        _log_frame(self, "Recv", answer)
+        return answer
 
     return wrapper
 
 
+class StreamFramer:
+    """Выделение пакетов из потока байтов сокета. Байты, пришедшие после
+    конца пакета, сохраняются для следующего пакета.
+    """
+
+    def __init__(self, sock: socket) -> None:
+        """Инициализация буфера приёма для указанного сокета."""
+
+        self.socket = sock
+        self.splitter = FrameSplitter()
+
+    def reset(self) -> None:
+        """Удаление накопленных байтов."""
+
+        self.splitter.reset()
+
+    def read_frame(self) -> bytes:
+        """Чтение одного полного пакета."""
+
+        splitter = self.splitter
+        while (frame := splitter.next_frame()) is None:
+            count = self.socket.recv_into(splitter.writable())
+            if not count:
+                splitter.reset()
+                msg = "Connection closed"
+                raise SmsdConnectionError(msg)
+            splitter.advance(count)
+
+        return frame
+
+
 class SmsdUsbClient(Smsd):
     """Класс клиента для управления SMSD-LAN через USB."""
 
     def __init__(self, address: str, timeout: float = 1.0) -> None:
         """Инициализация класса клиента с указанными параметрами."""
 
+        self.tracer: FrameTracer | None = None
         self.socket = Serial(port=address, baudrate=115200, timeout=timeout)
         super().__init__()
 
@@ -63,9 +172,10 @@ class SmsdUsbClient(Smsd):
     def _escape(packet: bytes) -> bytes:
         """Замена специальных символов внутри пакета парой байтов."""
 
-        packet = packet.replace(b"\xFA", b"\xFE\x7A").\
-                        replace(b"\xFB", b"\xFE\x7B").\
-                        replace(b"\xFE", b"\xFE\x7E")
+        # 0xFE заменяется первым, чтобы не затронуть уже вставленные пары
+        packet = packet.replace(b"\xFE", b"\xFE\x7E").\
+                        replace(b"\xFA", b"\xFE\x7A").\
+                        replace(b"\xFB", b"\xFE\x7B")
         return b"\xFA" + packet + b"\xFB"
 
     @staticmethod
@@ -73,20 +183,40 @@ class SmsdUsbClient(Smsd):
         """Обратная замена пары байтов внутри пакета на символы."""
 
         packet = packet[1:-1]
-        return packet.replace(b"\xFE\x7A", b"\xFA").\
-                      replace(b"\xFE\x7B", b"\xFB").\
-                      replace(b"\xFE\x7E", b"\xFE")
+        result = packet.replace(b"\xFE\x7A", b"\xFA").\
+                        replace(b"\xFE\x7B", b"\xFB").\
+                        replace(b"\xFE\x7E", b"\xFE")
+
+        # каждая допустимая пара сокращает пакет ровно на один байт
+        if len(packet) - len(result) != packet.count(b"\xFE"):
+            msg = "Invalid escape sequence"
+            raise SmsdError(msg)
+
+        return result
 
 
 class SmsdTcpClient(Smsd):
-    """Класс клиента для управления SMSD-LAN по протоколу TCP."""
+    """Класс клиента для управления SMSD-LAN по протоколу TCP. При потере
+    соединения следующая команда переподключается к устройству (с
+    увеличивающейся паузой между неудачными попытками) и повторяет
+    авторизацию с последним использованным паролем.
+    """
 
     def __init__(self, address: str, port: int = 5000, timeout: float = 1.0) -> None:
         """Инициализация класса клиента с указанными параметрами."""
 
-        self.socket = socket(AF_INET, SOCK_STREAM)
-        self.socket.settimeout(timeout)
-        self.socket.connect((address, port))
+        self.tracer: FrameTracer | None = None
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.reconnects = 0             # количество успешных переподключений
+        self.reconnect_errors = 0       # количество неудачных попыток
+        self._auth_password: str | None = None
+        self._auth_time = 0.0
+        self._backoff = 0.0
+        self._retry_time = 0.0
+        self.socket: socket | None = None
+        self._connect()
         super().__init__()
 
     def __del__(self) -> None:
@@ -95,12 +225,160 @@ class SmsdTcpClient(Smsd):
         if self.socket:
             self.socket.close()
 
-    @log
-    def _bus_exchange(self, packet: bytes) -> bytes:
-        """Обмен по интерфейсу."""
+    def _connect(self) -> None:
+        """Установка соединения с включенным TCP keepalive."""
+
+        sock = create_connection((self.address, self.port), self.timeout)
+        _set_keepalive(sock)
+
+        self.socket = sock
+        self.framer = StreamFramer(sock)
+
+    def _disconnect(self) -> None:
+        """Закрытие соединения после ошибки обмена. Контроллер мог быть
+        перезапущен, поэтому кэш параметров сбрасывается.
+        """
 
-        self.socket.sendall(packet)
-        return self.socket.recv(2048)
+        self.clear_cache()
+        if self.socket:
+            self.socket.close()
+            self.socket = None
+
+    def _reconnect(self) -> None:
+        """Повторное подключение, получение версии протокола и авторизация."""
+
+        if monotonic() < self._retry_time:
+            msg = "Connection lost, reconnect postponed"
+            raise SmsdConnectionError(msg)
+
+        try:
+            self._connect()
+            self.version = self.get_version()
+            if self._auth_password is not None:
+                sleep(max(0.0, self._auth_time + _ACCESS_TIMEOUT - monotonic()))
+                self.authorization(self._auth_password)
+        except (OSError, SmsdError) as err:
+            self._disconnect()
+            self.reconnect_errors += 1
+            self._backoff = min(max(self._backoff * 2, _BACKOFF_MIN), _BACKOFF_MAX)
+            self._retry_time = monotonic() + self._backoff
+            msg = "Reconnect failed"
+            raise SmsdConnectionError(msg) from err
+
+        self.reconnects += 1
+        self._backoff = 0.0
+        _logger.info("Reconnected to %s:%d", self.address, self.port)
+
+    def _ensure_connected(self) -> socket:
+        """Получение сокета с переподключением при необходимости."""
+
+        if self.socket is None:
+            self._reconnect()
+        return self.socket      # type: ignore
 
+    @log
+    def _bus_exchange(self, packet: bytes) -> bytes:
+        """Обмен по интерфейсу. Ответы с чужим идентификатором, оставшиеся
+        от прерванных запросов, пропускаются.
+        """
+
+        sock = self._ensure_connected()
+        try:
+            sock.sendall(packet)
+            while True:
+                answer = self.framer.read_frame()
+                if not packet or answer[3] == packet[3]:
+                    return answer
+                _logger.debug("Skip frame with ID %d", answer[3])
+        except SocketTimeout:
+            raise
+        except (OSError, SmsdConnectionError):
+            self._disconnect()
+            raise
+
+    def authorization(self, password: str = "") -> bool:
+        """Авторизации пользователя с помощью пароля. Пароль запоминается
+        для повторной авторизации после переподключения.
+        """
+
+        self._auth_time = monotonic()
+        result = super().authorization(password)
+        self._auth_password = password
+        return result
+
+    def set_password(self, password: str = "") -> bool:
+        """Установка нового пароля для авторизации."""
+
+        result = super().set_password(password)
+        if self._auth_password is not None:
+            self._auth_password = password
+        return result
+
+    def pipeline(self, commands: Iterable[tuple[COMMAND, int]], window: int = 8,
+                       timeout: float | None = None) -> list[Structure]:
+        """Отправка команд POWERSTEP01 без ожидания ответа на каждую. В сети
+        одновременно находится не более window запросов, ответы сопоставляются
+        с запросами по полю ID через SmsdConnection. Если ответ на запрос не получен за timeout
+        секунд, вызывается исключение. Ошибки выполнения команд не проверяются,
+        поле ERROR_OR_COMMAND результатов анализирует вызывающая сторона.
+        Успешные команды учитываются в кэше параметров так же, как
+        одиночные; после ошибки команды записи кэш сбрасывается.
+        """
+
+        if not 0 < window < 256:
+            msg = "Window must be in range 1..255"
+            raise SmsdError(msg)
 
-__all__ = ["SmsdTcpClient", "SmsdUsbClient"]
+        commands = list(commands)
+        results: list[Structure] = [None] * len(commands)     # type: ignore
+        connection = SmsdConnection(self.version)
+        requests: dict[int, tuple[int, float]] = {}     # ID - номер команды и срок ответа
+        if timeout is None:
+            timeout = self.timeout
+        sock = self._ensure_connected()
+        sent = 0
+
+        try:
+            while sent < len(commands) or requests:
+                while sent < len(commands) and len(requests) < window:
+                    request = self._make_powerstep01_request(*commands[sent])
+                    cmd_id = connection.expect(request)
+                    _log_frame(self, "Send", request)
+                    sock.sendall(request)
+                    requests[cmd_id] = (sent, monotonic() + timeout)
+                    sent += 1
+
+                _, deadline = next(iter(requests.values()))
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    self.clear_cache()
+                    msg = "Response timeout"
+                    raise SmsdError(msg)
+
+                sock.settimeout(remaining)
+                answer = self.framer.read_frame()
+                _log_frame(self, "Recv", answer)
+                for cmd_id, frame in connection.receive(answer):
+                    index, _ = requests.pop(cmd_id)
+                    results[index] = result = \
+                        self._parse_answer(frame, COMMANDS_RETURN_DATA_TYPE)
+                    command, value = commands[index]
+                    if result.ERROR_OR_COMMAND not in _ERRORS:
+                        self._track(command, value, result)
+                    elif command not in _READ_ONLY:
+                        self.clear_cache()
+        except SocketTimeout:
+            self.clear_cache()
+            msg = "Response timeout"
+            raise SmsdError(msg) from None
+        except (OSError, SmsdConnectionError):
+            self._disconnect()
+            raise
+        finally:
+            if self.socket is sock:
+                sock.settimeout(self.timeout)
+
+        return results
+
+
+__all__ = ["FrameTracer", "SmsdTcpClient", "SmsdUsbClient", "StreamFramer"]
@@ -0,0 +1,272 @@
+#! /usr/bin/env python3
+
+"""Формирование и разбор пакетов протокола SMSD-LAN без ввода-вывода."""
+
+from __future__ import annotations
+
+from ctypes import Structure, sizeof
+from itertools import cycle
+from struct import Struct
+
+from .protocol import CMD_TYPE, COMMAND, SMSD_CMD_TYPE
+
+
+class SmsdError(Exception):
+    pass
+
+
+class SmsdConnectionError(SmsdError):
+    pass
+
+
+_HEADER = Struct("<BBBBH")      # XOR, VER, TYPE, ID, LENGTH
+_DATA_SIZE = 1024
+_FRAME_SIZE = _HEADER.size + _DATA_SIZE
+
+_POWERSTEP01_FRAME = Struct("<BBBBHI")  # заголовок и слово SMSD_CMD_TYPE
+_COMMAND_SHIFT = 4
+_DATA_SHIFT = 10
+_DATA_MASK = 0x3FFFFF
+
+
+def checksum(data: bytes | memoryview | list[int]) -> int:
+    """Вычисление контрольной суммы."""
+
+    return -sum(data) & 0xFF
+
+
+def payload(frame: bytes | bytearray | memoryview) -> memoryview:
+    """Проверка пакета и выделение информационной части."""
+
+    view = memoryview(frame)
+    if len(view) < _HEADER.size:
+        msg = "Invalid message length"
+        raise SmsdError(msg)
+
+    xor, _, _, _, length = _HEADER.unpack_from(view)
+    size = _HEADER.size + length
+    if len(view) < size:
+        msg = "Invalid message length"
+        raise SmsdError(msg)
+    if checksum(view[1:size]) != xor:
+        msg = "Invalid message checksum"
+        raise SmsdError(msg)
+
+    return view[_HEADER.size:size]
+
+
+def parse(frame: bytes | bytearray | memoryview, ret_type: type[Structure]) -> Structure:
+    """Расшифровка пакета в структуру ret_type. Недостающие в коротком
+    ответе байты считаются нулевыми.
+    """
+
+    return _decode(payload(frame), ret_type)
+
+
+def _decode(view: memoryview, ret_type: type[Structure]) -> Structure:
+    """Заполнение структуры ret_type из информационной части пакета."""
+
+    if len(view) >= sizeof(ret_type):
+        return ret_type.from_buffer_copy(view)
+
+    data = bytes(view).ljust(sizeof(ret_type), b"\x00")
+    return ret_type.from_buffer_copy(data)
+
+
+class FrameEncoder:
+    """Формирование пакетов запросов с последовательными номерами ID.
+    Каждый пакет формируется в собственном буфере, поэтому кодировщик
+    можно использовать из нескольких потоков.
+    """
+
+    def __init__(self, version: int = 0) -> None:
+        """Инициализация для указанной версии протокола."""
+
+        self.ids = cycle(range(256))
+        self.version = version
+
+    @property
+    def version(self) -> int:
+        return self._version
+
+    @version.setter
+    def version(self, version: int) -> None:
+        self._version = version
+        self._templates = self._make_templates()
+
+    def _make_templates(self) -> dict[COMMAND, tuple[int, int]]:
+        """Построение шаблонов пакетов для всех команд POWERSTEP01: слово
+        команды и сумма неизменных байтов пакета для контрольной суммы.
+        """
+
+        header = self._version + CMD_TYPE.CODE_CMD_POWERSTEP01 + sizeof(SMSD_CMD_TYPE)
+        templates = {}
+        for command in COMMAND:
+            word = command << _COMMAND_SHIFT
+            templates[command] = (word, header + (word & 0xFF) + (word >> 8))
+        return templates
+
+    def request(self, command: CMD_TYPE, buffer: bytes) -> bytes:
+        """Формирование пакета для записи."""
+
+        length = len(buffer)
+        if length > _DATA_SIZE:
+            msg = "Data length exceeds 1024 bytes"
+            raise SmsdError(msg)
+
+        frame = bytearray(_HEADER.size + length)
+        _HEADER.pack_into(frame, 0, 0, self._version, command, next(self.ids), length)
+        frame[_HEADER.size:] = buffer
+        frame[0] = checksum(memoryview(frame)[1:])
+
+        return bytes(frame)
+
+    def powerstep01(self, command: COMMAND, value: int) -> bytes:
+        """Формирование пакета команды POWERSTEP01 по готовому шаблону."""
+
+        word, total = self._templates[command]
+        data = (value & _DATA_MASK) << _DATA_SHIFT
+        cmd_id = next(self.ids)
+        # биты DATA не пересекаются с битами COMMAND, поэтому сумма байтов
+        # слова складывается из суммы шаблона и суммы байтов DATA
+        total += cmd_id + (data >> 8 & 0xFF) + (data >> 16 & 0xFF) + (data >> 24)
+
+        return _POWERSTEP01_FRAME.pack(-total & 0xFF, self._version,
+                                       CMD_TYPE.CODE_CMD_POWERSTEP01, cmd_id,
+                                       sizeof(SMSD_CMD_TYPE), word | data)
+
+
+class FrameSplitter:
+    """Выделение пакетов из потока байтов. Байты, пришедшие после конца
+    пакета, сохраняются для следующего пакета.
+    """
+
+    def __init__(self) -> None:
+        """Инициализация буфера приёма."""
+
+        self._buffer = bytearray(2 * _FRAME_SIZE)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    def reset(self) -> None:
+        """Удаление накопленных байтов."""
+
+        self._start = self._end = 0
+
+    def writable(self) -> memoryview:
+        """Свободная часть буфера для приёма (например, через recv_into).
+        Вызывается, когда next_frame вернул None, поэтому в буфере меньше
+        одного пакета и после сдвига свободно не меньше размера пакета.
+        """
+
+        if self._end + _FRAME_SIZE > len(self._buffer):
+            count = self._end - self._start
+            self._view[:count] = self._view[self._start:self._end]
+            self._start, self._end = 0, count
+        return self._view[self._end:]
+
+    def advance(self, count: int) -> None:
+        """Учёт count байтов, записанных в writable."""
+
+        self._end += count
+
+    def next_frame(self) -> bytes | None:
+        """Очередной полный пакет или None, если данных недостаточно."""
+
+        start = self._start
+        if self._end - start < _HEADER.size:
+            return None
+
+        length = self._buffer[start + 4] | self._buffer[start + 5] << 8
+        if length > _DATA_SIZE:
+            self.reset()
+            msg = "Invalid message length"
+            raise SmsdError(msg)
+
+        size = _HEADER.size + length
+        if self._end - start < size:
+            return None
+
+        frame = bytes(self._view[start:start + size])
+        self._start = start + size
+        if self._start == self._end:
+            self._start = self._end = 0
+        return frame
+
+    def feed(self, data: bytes | bytearray | memoryview) -> list[bytes]:
+        """Приём байтов и выделение всех завершённых пакетов."""
+
+        frames = []
+        view = memoryview(data)
+        while view:
+            target = self.writable()
+            count = min(len(target), len(view))
+            target[:count] = view[:count]
+            self.advance(count)
+            view = view[count:]
+            while (frame := self.next_frame()) is not None:
+                frames.append(frame)
+        return frames
+
+
+class SmsdConnection:
+    """Состояние соединения без ввода-вывода: формирование запросов,
+    выделение пакетов из принятых байтов и сопоставление ответов запросам
+    по полю ID. Если версия протокола не задана, первый принятый пакет
+    считается приветствием устройства и задаёт версию.
+    """
+
+    def __init__(self, version: int | None = None) -> None:
+        """Инициализация состояния соединения."""
+
+        self.encoder = FrameEncoder(version or 0)
+        self.splitter = FrameSplitter()
+        self.greeting = version is None
+        self.pending: set[int] = set()
+        self.dropped = 0        # пакеты без ожидающего запроса
+
+    def send(self, command: CMD_TYPE, buffer: bytes) -> tuple[int, bytes]:
+        """Запрос с произвольными данными: номер ID и байты для передачи."""
+
+        request = self.encoder.request(command, buffer)
+        return self.expect(request), request
+
+    def send_powerstep01(self, command: COMMAND, value: int = 0) -> tuple[int, bytes]:
+        """Запрос команды POWERSTEP01: номер ID и байты для передачи."""
+
+        request = self.encoder.powerstep01(command, value)
+        return self.expect(request), request
+
+    def expect(self, request: bytes) -> int:
+        """Регистрация запроса, ответ на который ожидается. Возвращает
+        номер ID запроса.
+        """
+
+        cmd_id = request[3]
+        if cmd_id in self.pending:
+            msg = f"Request ID {cmd_id} is already pending"
+            raise SmsdError(msg)
+        self.pending.add(cmd_id)
+        return cmd_id
+
+    def receive(self, data: bytes | bytearray | memoryview) -> list[tuple[int, bytes]]:
+        """Приём байтов. Возвращает ответы на ожидающие запросы: номер ID и
+        пакет, который разбирается функцией parse.
+        """
+
+        answers = []
+        for frame in self.splitter.feed(data):
+            if self.greeting:
+                self.greeting = False
+                self.encoder.version = frame[1]
+            elif frame[3] in self.pending:
+                self.pending.discard(frame[3])
+                answers.append((frame[3], frame))
+            else:
+                self.dropped += 1
+        return answers
+
+
+__all__ = ["FrameEncoder", "FrameSplitter", "SmsdConnection", "SmsdConnectionError",
+           "SmsdError", "checksum", "parse", "payload"]
@@ -0,0 +1,95 @@
+#! /usr/bin/env python3
+
+"""Одновременное управление группой контроллеров SMSD-LAN."""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor, wait
+from types import TracebackType
+from typing import Any, Callable, Iterable, Mapping
+
+from .client import SmsdTcpClient
+from .smsd import Smsd
+
+
+class SmsdFleet:
+    """Группа клиентов, команды которой выполняются на всех контроллерах
+    одновременно. Результат команды - словарь, в котором каждому адресу
+    соответствует возвращённое значение или возникшее исключение.
+    Пример: fleet.hard_stop(), fleet.get_abs_pos().
+
+    Контроллеры, к которым не удалось подключиться, хранятся в словаре
+    errors вместе с ошибкой подключения и входят в результат каждой
+    команды с этой ошибкой.
+    """
+
+    def __init__(self, clients: Mapping[str, Smsd],
+                       errors: Mapping[str, BaseException] | None = None) -> None:
+        """Инициализация группы по словарю адрес - клиент и словарю адрес -
+        ошибка подключения.
+        """
+
+        self.clients = dict(clients)
+        self.errors = dict(errors or {})
+        self._executor = ThreadPoolExecutor(max_workers=max(len(self.clients), 1),
+                                            thread_name_prefix="smsd-fleet")
+
+    @classmethod
+    def connect(cls, addresses: Iterable[str], port: int = 5000,
+                     timeout: float = 1.0) -> SmsdFleet:
+        """Одновременное подключение к контроллерам по TCP. Ошибки
+        подключения сохраняются в словаре errors группы.
+        """
+
+        addresses = list(addresses)
+        with ThreadPoolExecutor(max_workers=max(len(addresses), 1)) as executor:
+            futures = {address: executor.submit(SmsdTcpClient, address, port, timeout)
+                       for address in addresses}
+
+        errors = {address: error for address, future in futures.items()
+                  if (error := future.exception()) is not None}
+        return cls({address: future.result() for address, future in futures.items()
+                    if address not in errors}, errors)
+
+    def close(self) -> None:
+        """Остановка пула потоков."""
+
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> SmsdFleet:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                       exc_value: BaseException | None,
+                       traceback: TracebackType | None) -> None:
+        self.close()
+
+    def call(self, name: str, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        """Одновременный вызов метода name у всех клиентов группы. Для
+        контроллеров без подключения возвращается ошибка подключения.
+        """
+
+        futures = {address: self._executor.submit(getattr(client, name), *args, **kwargs)
+                   for address, client in self.clients.items()}
+        wait(futures.values())
+
+        results: dict[str, Any] = dict(self.errors)
+        results.update((address, future.exception() or future.result())
+                       for address, future in futures.items())
+        return results
+
+    def __getattr__(self, name: str) -> Callable[..., dict[str, Any]]:
+        """Команда класса Smsd, выполняемая на всех контроллерах группы."""
+
+        if name.startswith("_") or not callable(getattr(Smsd, name, None)):
+            raise AttributeError(name)
+
+        def broadcast(*args: Any, **kwargs: Any) -> dict[str, Any]:
+            return self.call(name, *args, **kwargs)
+
+        broadcast.__name__ = name
+        broadcast.__doc__ = getattr(Smsd, name).__doc__
+        return broadcast
+
+
+__all__ = ["SmsdFleet"]
@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+
+"""Оценка длительности перемещений шагового двигателя."""
+
+from __future__ import annotations
+
+from math import inf, sqrt
+from typing import NamedTuple
+
+
+class MotionProfile(NamedTuple):
+    """Параметры трапециевидного профиля скорости: скорости в шагах в
+    секунду, ускорение и замедление в шагах в секунду за секунду. Значения
+    по умолчанию соответствуют настройкам POWERSTEP01 после сброса.
+    """
+
+    max_speed: float = 991.8
+    min_speed: float = 0.0
+    acc: float = 2008.0
+    dec: float = 2008.0
+
+    def move_time(self, steps: int) -> float:
+        """Длительность перемещения на steps шагов из состояния покоя."""
+
+        steps = abs(steps)
+        if not steps:
+            return 0.0
+
+        start = max(self.min_speed, 0.0)
+        top = max(self.max_speed, start)
+        if top <= 0:
+            return inf
+        if self.acc <= 0 or self.dec <= 0 or top == start:
+            return steps / top
+
+        acc_steps = (top * top - start * start) / (2 * self.acc)
+        dec_steps = (top * top - start * start) / (2 * self.dec)
+        if acc_steps + dec_steps <= steps:
+            return (top - start) / self.acc + (top - start) / self.dec + \
+                   (steps - acc_steps - dec_steps) / top
+
+        # треугольный профиль: максимальная скорость не достигается
+        peak = sqrt(start * start + 2 * steps * self.acc * self.dec / (self.acc + self.dec))
+        return (peak - start) / self.acc + (peak - start) / self.dec
+
+
+__all__ = ["MotionProfile"]
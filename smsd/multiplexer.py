@@ -0,0 +1,593 @@
+#! /usr/bin/env python3
+
+"""Обслуживание множества контроллеров SMSD-LAN в одном потоке без asyncio."""
+
+from __future__ import annotations
+
+import logging
+from collections import deque
+from concurrent.futures import Future
+from contextlib import suppress
+from errno import EINPROGRESS, EWOULDBLOCK
+from heapq import heappop, heappush
+from itertools import count
+from os import strerror
+from selectors import EVENT_READ, EVENT_WRITE, DefaultSelector
+from socket import AF_INET, SO_ERROR, SOCK_STREAM, SOL_SOCKET, socket
+from time import monotonic
+from types import TracebackType
+from typing import Any, Callable, Coroutine, Generator
+
+from serial import Serial
+
+from .client import SmsdUsbClient, _set_keepalive
+from .core import SmsdConnection
+from .smsd import AsyncSmsd, SmsdConnectionError, SmsdError
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+_RECV_SIZE = 65536
+
+
+class _Waiter:
+    """Результат, ожидаемый сопрограммами. Пока результата нет, сопрограмма
+    возвращает управление циклу мультиплексора.
+    """
+
+    __slots__ = ("done", "error", "tasks", "value")
+
+    def __init__(self) -> None:
+        self.tasks: list[_Task] = []
+        self.done = False
+        self.value: Any = None
+        self.error: BaseException | None = None
+
+    def __await__(self) -> Generator[_Waiter, None, Any]:
+        if not self.done:
+            yield self
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class _SharedWaiter(_Waiter):
+    """Общий результат объединённого запроса чтения с методами
+    asyncio.Future, которые использует AsyncSmsd._powerstep01.
+    """
+
+    __slots__ = ("mux",)
+
+    def __init__(self, mux: SmsdMultiplexer) -> None:
+        super().__init__()
+        self.mux = mux
+
+    def set_result(self, value: Any) -> None:
+        self.mux._resolve(self, value)
+
+    def set_exception(self, error: BaseException) -> None:
+        self.mux._resolve(self, error=error)
+
+    def exception(self) -> BaseException | None:
+        return self.error
+
+
+class _Task:
+    """Сопрограмма, выполняемая мультиплексором, и её результат."""
+
+    __slots__ = ("coro", "future")
+
+    def __init__(self, coro: Coroutine[Any, Any, Any]) -> None:
+        self.coro = coro
+        self.future: Future[Any] = Future()
+
+
+class _Channel:
+    """Неблокирующее соединение с одним контроллером."""
+
+    def __init__(self, mux: SmsdMultiplexer, timeout: float) -> None:
+        self.mux = mux
+        self.timeout = timeout
+        self.output = bytearray()
+        self.events = 0
+        self.closed = False
+
+    def fileno(self) -> int:
+        raise NotImplementedError
+
+    def _send(self, data: bytearray) -> int:
+        raise NotImplementedError
+
+    def _close_transport(self) -> None:
+        raise NotImplementedError
+
+    def _waiters(self) -> list[_Waiter]:
+        """Ожидания, которые завершаются ошибкой при закрытии соединения."""
+
+        raise NotImplementedError
+
+    def on_readable(self) -> None:
+        raise NotImplementedError
+
+    def on_writable(self) -> None:
+        self.flush()
+
+    def _check_open(self) -> None:
+        if self.closed:
+            msg = "Connection closed"
+            raise SmsdConnectionError(msg)
+
+    def write(self, data: bytes) -> None:
+        """Отправка данных; неотправленная часть передаётся, когда
+        соединение снова готово к записи.
+        """
+
+        self.output += data
+        self.flush()
+
+    def flush(self) -> None:
+        if self.output:
+            try:
+                sent = self._send(self.output)
+            except BlockingIOError:
+                sent = 0
+            except OSError as err:
+                self.close(err)
+                return
+            del self.output[:sent]
+        self.mux._watch(self, EVENT_READ | EVENT_WRITE if self.output else EVENT_READ)
+
+    def close(self, err: BaseException | None = None) -> None:
+        """Закрытие соединения; ожидающие ответа команды завершаются
+        ошибкой SmsdConnectionError.
+        """
+
+        if self.closed:
+            return
+
+        self.closed = True
+        self.mux._forget(self)
+        self._close_transport()
+        if err is not None:
+            _logger.debug("Connection closed: %s", err)
+        for waiter in self._waiters():
+            error = SmsdConnectionError("Connection closed")
+            error.__cause__ = err
+            self.mux._resolve(waiter, error=error)
+
+
+class _TcpChannel(_Channel):
+    """Соединение по TCP: ответы сопоставляются с запросами по полю ID,
+    поэтому одновременно может выполняться несколько команд.
+    """
+
+    def __init__(self, mux: SmsdMultiplexer, sock: socket, timeout: float) -> None:
+        super().__init__(mux, timeout)
+        self.socket = sock
+        self.connection = SmsdConnection()
+        self.connecting = _Waiter()
+        self.greeting = _Waiter()      # версия протокола из первого пакета
+        self.requests: dict[int, _Waiter] = {}
+
+    def fileno(self) -> int:
+        return self.socket.fileno()
+
+    def _send(self, data: bytearray) -> int:
+        return self.socket.send(data)
+
+    def _close_transport(self) -> None:
+        self.socket.close()
+
+    def _waiters(self) -> list[_Waiter]:
+        waiters = [self.connecting, self.greeting, *self.requests.values()]
+        self.requests.clear()
+        return waiters
+
+    def on_writable(self) -> None:
+        if not self.connecting.done:
+            if error := self.socket.getsockopt(SOL_SOCKET, SO_ERROR):
+                self.close(OSError(error, strerror(error)))
+                return
+            self.mux._resolve(self.connecting)
+        self.flush()
+
+    def on_readable(self) -> None:
+        try:
+            data = self.socket.recv(_RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            self.close(err)
+            return
+        if not data:
+            self.close()
+            return
+
+        greeting = self.connection.greeting
+        try:
+            answers = self.connection.receive(data)
+        except SmsdError as err:
+            self.close(err)
+            return
+        if greeting and not self.connection.greeting:
+            self.mux._resolve(self.greeting, self.connection.encoder.version)
+        for cmd_id, frame in answers:
+            if (waiter := self.requests.pop(cmd_id, None)) is not None:
+                self.mux._resolve(waiter, frame)
+
+    async def exchange(self, packet: bytes) -> bytes:
+        """Обмен пакетом с устройством. Если запрос с тем же ID ещё
+        выполняется, отправка откладывается до его завершения.
+        """
+
+        cmd_id = packet[3]
+        while (previous := self.requests.get(cmd_id)) is not None:
+            with suppress(Exception):
+                await previous
+
+        self._check_open()
+        waiter = self.requests[cmd_id] = _Waiter()
+        self.connection.expect(packet)
+        self.write(packet)
+        self.mux._call_later(self.timeout, lambda: self._expire(cmd_id, waiter))
+        return await waiter
+
+    def _expire(self, cmd_id: int, waiter: _Waiter) -> None:
+        """Завершение запроса без ответа; поздний ответ будет пропущен."""
+
+        if not waiter.done:
+            del self.requests[cmd_id]
+            self.connection.pending.discard(cmd_id)
+            self.mux._resolve(waiter, error=SmsdError("Response timeout"))
+
+
+class _SerialChannel(_Channel):
+    """Соединение через USB: команды выполняются по одной, пакеты
+    обрамляются байтами 0xFA и 0xFB.
+    """
+
+    def __init__(self, mux: SmsdMultiplexer, port: Serial, timeout: float) -> None:
+        super().__init__(mux, timeout)
+        self.port = port
+        self.buffer = bytearray()
+        self.current: _Waiter | None = None
+
+    def fileno(self) -> int:
+        return self.port.fileno()
+
+    def _send(self, data: bytearray) -> int:
+        return self.port.write(data) or 0
+
+    def _close_transport(self) -> None:
+        self.port.close()
+
+    def _waiters(self) -> list[_Waiter]:
+        waiters = [] if self.current is None else [self.current]
+        self.current = None
+        return waiters
+
+    def on_readable(self) -> None:
+        try:
+            data = self.port.read(_RECV_SIZE)
+        except OSError as err:
+            self.close(err)
+            return
+
+        if (waiter := self.current) is None:
+            return
+        self.buffer += data
+        if (end := self.buffer.find(b"\xFB")) < 0:
+            return
+
+        answer = bytes(self.buffer[:end + 1])
+        if answer[0] != 0xFA:
+            self._finish(waiter, error=SmsdError("Invalid message format"))
+            return
+        try:
+            self._finish(waiter, SmsdUsbClient._unescape(answer))
+        except SmsdError as err:
+            self._finish(waiter, error=err)
+
+    def _finish(self, waiter: _Waiter, value: Any = None,
+                      error: BaseException | None = None) -> None:
+        """Завершение текущего обмена; следующий обмен может начинаться."""
+
+        if self.current is waiter:
+            self.current = None
+            self.mux._resolve(waiter, value, error)
+
+    async def exchange(self, packet: bytes) -> bytes:
+        """Обмен пакетом с устройством после завершения предыдущего обмена."""
+
+        while self.current is not None:
+            with suppress(Exception):
+                await self.current
+
+        self._check_open()
+        waiter = self.current = _Waiter()
+        self.buffer.clear()
+        self.write(SmsdUsbClient._escape(packet))
+        self.mux._call_later(self.timeout,
+                             lambda: self._finish(waiter, error=SmsdError("Response timeout")))
+        return await waiter
+
+
+class MultiplexedSmsd(AsyncSmsd):
+    """Контроллер, обслуживаемый SmsdMultiplexer. Набор функций тот же, что
+    у Smsd, но функции являются сопрограммами, которые выполняются методами
+    run и spawn мультиплексора.
+    """
+
+    def __init__(self, channel: _TcpChannel | _SerialChannel, version: int) -> None:
+        """Инициализация клиента для установленного соединения."""
+
+        self._channel = channel
+        super().__init__(version)
+
+    @property
+    def closed(self) -> bool:
+        return self._channel.closed
+
+    async def close(self) -> None:
+        """Закрытие соединения с устройством."""
+
+        self._channel.close()
+
+    async def _bus_exchange(self, packet: bytes) -> bytes:     # type: ignore
+        """Обмен по интерфейсу."""
+
+        return await self._channel.exchange(packet)
+
+    async def _sleep(self, delay: float) -> None:
+        """Пауза между опросами."""
+
+        await self._channel.mux.sleep(delay)
+
+    def _create_waiter(self) -> _SharedWaiter:                 # type: ignore
+        """Общий результат объединённого запроса чтения."""
+
+        return _SharedWaiter(self._channel.mux)
+
+    async def _await_waiter(self, waiter: _SharedWaiter) -> Any:  # type: ignore
+        """Ожидание общего результата. Мультиплексор не отменяет сопрограммы,
+        поэтому защищать результат от отмены не нужно.
+        """
+
+        return await waiter
+
+    async def get_version(self) -> int:                        # type: ignore
+        """Получение версии протокола. По TCP версия берётся из пакета,
+        который устройство присылает при подключении.
+        """
+
+        if isinstance(self._channel, _TcpChannel):
+            return await self._channel.greeting
+        return await super().get_version()
+
+
+class SmsdMultiplexer:
+    """Цикл событий на основе selectors, который в одном потоке обслуживает
+    множество контроллеров по TCP и USB без asyncio. Функции контроллеров
+    MultiplexedSmsd - сопрограммы, которые выполняются методом run
+    (одновременно, до завершения всех) или spawn (в фоне, пока вызывается
+    run_once):
+
+        with SmsdMultiplexer() as mux:
+            devices = mux.run(*(mux.open_tcp(address) for address in addresses))
+            positions = mux.run(*(device.get_abs_pos() for device in devices))
+
+    Ожидать внутри сопрограмм можно только функции контроллеров и sleep
+    мультиплексора. Последовательные порты поддерживаются только в
+    POSIX-системах.
+    """
+
+    def __init__(self) -> None:
+        """Инициализация цикла событий."""
+
+        self.selector = DefaultSelector()
+        self._ready: deque[_Task] = deque()
+        self._timers: list[tuple[float, int, Callable[[], None]]] = []
+        self._seq = count()
+        self._channels: set[_Channel] = set()
+
+    # Сопрограммы
+
+    def spawn(self, coro: Coroutine[Any, Any, Any]) -> Future[Any]:
+        """Запуск сопрограммы. Возвращает Future с её результатом."""
+
+        task = _Task(coro)
+        self._ready.append(task)
+        return task.future
+
+    def _step(self, task: _Task) -> None:
+        """Выполнение сопрограммы до следующего ожидания."""
+
+        if task.future.cancelled():
+            task.coro.close()
+            return
+
+        try:
+            waiter = task.coro.send(None)
+        except StopIteration as stop:
+            task.future.set_result(stop.value)
+        except Exception as err:
+            _logger.debug("Task %r failed", task.coro, exc_info=True)
+            task.future.set_exception(err)
+        except BaseException as err:
+            # KeyboardInterrupt и подобные прерывают и цикл мультиплексора
+            task.future.set_exception(err)
+            raise
+        else:
+            if not isinstance(waiter, _Waiter):
+                task.coro.close()
+                msg = f"Unsupported awaitable {waiter!r}"
+                task.future.set_exception(SmsdError(msg))
+            elif waiter.done:
+                self._ready.append(task)
+            else:
+                waiter.tasks.append(task)
+
+    def _resolve(self, waiter: _Waiter, value: Any = None,
+                       error: BaseException | None = None) -> None:
+        """Завершение ожидания и возобновление ожидающих сопрограмм."""
+
+        if waiter.done:
+            return
+
+        waiter.done = True
+        waiter.value = value
+        waiter.error = error
+        self._ready.extend(waiter.tasks)
+        waiter.tasks.clear()
+
+    def _call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        heappush(self._timers, (monotonic() + delay, next(self._seq), callback))
+
+    def _limit(self, waiter: _Waiter, timeout: float, message: str = "Response timeout") -> None:
+        """Завершение ожидания ошибкой SmsdError, если за timeout секунд
+        результат не получен.
+        """
+
+        self._call_later(timeout, lambda: self._resolve(waiter, error=SmsdError(message)))
+
+    async def sleep(self, delay: float) -> None:
+        """Пауза внутри сопрограммы: await mux.sleep(delay)."""
+
+        waiter = _Waiter()
+        self._call_later(delay, lambda: self._resolve(waiter))
+        await waiter
+
+    # Соединения
+
+    def _watch(self, channel: _Channel, events: int) -> None:
+        """Выбор событий, ожидаемых для соединения."""
+
+        if channel.closed or channel.events == events:
+            return
+        if channel.events:
+            self.selector.modify(channel, events, channel)
+        else:
+            self.selector.register(channel, events, channel)
+            self._channels.add(channel)
+        channel.events = events
+
+    def _forget(self, channel: _Channel) -> None:
+        if channel.events:
+            self.selector.unregister(channel)
+            channel.events = 0
+        self._channels.discard(channel)
+
+    async def open_tcp(self, address: str, port: int = 5000,
+                             timeout: float = 1.0) -> MultiplexedSmsd:
+        """Подключение к устройству по TCP и получение версии протокола."""
+
+        sock = socket(AF_INET, SOCK_STREAM)
+        sock.setblocking(False)
+        _set_keepalive(sock)
+
+        channel = _TcpChannel(self, sock, timeout)
+        error = sock.connect_ex((address, port))
+        if error not in (0, EINPROGRESS, EWOULDBLOCK):
+            sock.close()
+            msg = f"Connect to {address}:{port} failed"
+            raise SmsdConnectionError(msg) from OSError(error, strerror(error))
+
+        self._watch(channel, EVENT_READ | EVENT_WRITE)
+        self._limit(channel.connecting, timeout, "Connect timeout")
+        self._limit(channel.greeting, timeout, "Greeting timeout")
+        try:
+            await channel.connecting
+            version = await channel.greeting
+        except BaseException:
+            channel.close()
+            raise
+
+        return MultiplexedSmsd(channel, version)
+
+    async def open_usb(self, address: str, timeout: float = 1.0) -> MultiplexedSmsd:
+        """Открытие последовательного порта и получение версии протокола."""
+
+        port = Serial(port=address, baudrate=115200, timeout=0, write_timeout=0)
+        channel = _SerialChannel(self, port, timeout)
+        self._watch(channel, EVENT_READ)
+        device = MultiplexedSmsd(channel, 0)
+        try:
+            device.version = await device.get_version()
+        except BaseException:
+            channel.close()
+            raise
+
+        return device
+
+    # Цикл событий
+
+    def run_once(self, timeout: float | None = None) -> None:
+        """Одна итерация цикла: ожидание событий не дольше timeout секунд,
+        обработка готовых соединений, таймеров и сопрограмм.
+        """
+
+        if self._ready:
+            timeout = 0.0
+        elif self._timers:
+            delay = max(self._timers[0][0] - monotonic(), 0.0)
+            timeout = delay if timeout is None else min(delay, timeout)
+        elif timeout is None and not self._channels:
+            msg = "Nothing to wait for"
+            raise SmsdError(msg)
+
+        if self._channels:
+            for key, events in self.selector.select(timeout):
+                channel = key.data
+                if events & EVENT_WRITE and not channel.closed:
+                    channel.on_writable()
+                if events & EVENT_READ and not channel.closed:
+                    channel.on_readable()
+        elif timeout:
+            self.selector.select(timeout)
+
+        now = monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            heappop(self._timers)[2]()
+
+        for _ in range(len(self._ready)):
+            self._step(self._ready.popleft())
+
+    def run(self, *coros: Coroutine[Any, Any, Any],
+                  return_exceptions: bool = False) -> list[Any]:
+        """Одновременное выполнение сопрограмм до завершения всех. Возвращает
+        результаты в порядке сопрограмм. Если return_exceptions истинно,
+        исключения возвращаются вместо результатов, иначе вызывается первое
+        из них.
+        """
+
+        futures = [self.spawn(coro) for coro in coros]
+        while not all(future.done() for future in futures):
+            self.run_once()
+
+        results = []
+        for future in futures:
+            if (error := future.exception()) is not None:
+                if not return_exceptions:
+                    raise error
+                results.append(error)
+            else:
+                results.append(future.result())
+        return results
+
+    def close(self) -> None:
+        """Закрытие всех соединений."""
+
+        for channel in list(self._channels):
+            channel.close()
+        self.selector.close()
+
+    def __enter__(self) -> SmsdMultiplexer:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                       exc_value: BaseException | None,
+                       traceback: TracebackType | None) -> None:
+        self.close()
+
+
+__all__ = ["MultiplexedSmsd", "SmsdMultiplexer"]
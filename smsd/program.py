@@ -0,0 +1,384 @@
+#! /usr/bin/env python3
+
+"""Формирование программ управления для банков памяти SMSD-LAN."""
+
+from __future__ import annotations
+
+from array import array
+from typing import NamedTuple
+
+from .motion import MotionProfile
+from .protocol import CMD_TYPE, COMMAND, ERROR_OR_COMMAND
+from .smsd import _DATA_MASK, Smsd, SmsdError, command_word, program_image
+
+_VALUE_MIN = -(_DATA_MASK + 1) // 2
+_COMMANDS_MAX = 256     # номер команды в переходах занимает 8 бит
+COMMAND_TIME = 0.001    # оценка времени выполнения одной команды, с
+_LOOP_BODY_MAX = 16     # наибольшая длина тела цикла при свёртке повторов
+_LOOP_CYCLES_MAX = 0xFFF
+_LOOP_COMMANDS_MAX = 0x3FF
+
+_JUMPS = frozenset({
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM,
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN0,
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN1,
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_ZERO,
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN_ZERO,
+    COMMAND.CMD_POWERSTEP01_CALL_PROGRAM,
+})
+
+_CONTROL = _JUMPS | {
+    COMMAND.CMD_POWERSTEP01_END,
+    COMMAND.CMD_POWERSTEP01_RETURN_PROGRAM,
+    COMMAND.CMD_POWERSTEP01_LOOP_PROGRAM,
+    COMMAND.CMD_POWERSTEP01_STOP_PROGRAM_MEM,
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM0,
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM1,
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM2,
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM3,
+}
+
+_SETTERS = frozenset({
+    COMMAND.CMD_POWERSTEP01_SET_MODE,
+    COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_ACC,
+    COMMAND.CMD_POWERSTEP01_SET_DEC,
+    COMMAND.CMD_POWERSTEP01_SET_FS_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_MASK_EVENT,
+})
+
+_WAITS = frozenset({
+    COMMAND.CMD_POWERSTEP01_SET_WAIT,
+    COMMAND.CMD_POWERSTEP01_SET_WAIT_2,
+})
+
+_MOVES = frozenset({
+    COMMAND.CMD_POWERSTEP01_MOVE_F,
+    COMMAND.CMD_POWERSTEP01_MOVE_R,
+})
+
+
+class OptimizationReport(NamedTuple):
+    """Результат оптимизации программы."""
+
+    commands_before: int
+    commands_after: int
+    time_before: float      # оценка длительности выполнения, с
+    time_after: float
+
+    @property
+    def bytes_saved(self) -> int:
+        return (self.commands_before - self.commands_after) * 4
+
+    @property
+    def time_saved(self) -> float:
+        return self.time_before - self.time_after
+
+
+def estimate_time(commands: list[tuple[COMMAND, int | str]]) -> float:
+    """Оценка длительности выполнения программы без учёта переходов:
+    перемещения MOVE_F/MOVE_R по текущему профилю скорости, паузы
+    SET_WAIT в миллисекундах, повторы тел циклов LOOP_PROGRAM и
+    накладные расходы на каждую команду.
+    """
+
+    profile = MotionProfile()
+    times: list[float] = []
+    for command, value in commands:
+        elapsed = COMMAND_TIME
+        if isinstance(value, int):
+            if command == COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED:
+                profile = profile._replace(max_speed=value)
+            elif command == COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED:
+                profile = profile._replace(min_speed=value)
+            elif command == COMMAND.CMD_POWERSTEP01_SET_ACC:
+                profile = profile._replace(acc=value)
+            elif command == COMMAND.CMD_POWERSTEP01_SET_DEC:
+                profile = profile._replace(dec=value)
+            elif command in _MOVES:
+                elapsed += profile.move_time(value)
+            elif command in _WAITS:
+                elapsed += value / 1000
+            elif command == COMMAND.CMD_POWERSTEP01_LOOP_PROGRAM:
+                count = value & _LOOP_COMMANDS_MAX
+                elapsed += (value >> 10) * sum(times[len(times) - count:])
+        times.append(elapsed)
+
+    return sum(times)
+
+
+def _peephole(block: list[tuple[COMMAND, int | str]]) -> list[tuple[COMMAND, int | str]]:
+    """Удаление пустых пауз, объединение перемещений и удаление лишних
+    записей параметров внутри линейного участка программы.
+    """
+
+    merged: list[tuple[COMMAND, int | str]] = []
+    for command, value in block:
+        if command in _WAITS and value == 0:
+            continue
+        if command in _MOVES and merged and merged[-1][0] == command and \
+                0 <= merged[-1][1] + value <= _DATA_MASK:                   # type: ignore
+            merged[-1] = (command, merged[-1][1] + value)                   # type: ignore
+            continue
+        merged.append((command, value))
+
+    # из подряд идущих записей одного параметра действует только последняя
+    result: list[tuple[COMMAND, int | str]] = []
+    run: dict[COMMAND, int] = {}
+    for command, value in merged:
+        if command in _SETTERS:
+            if command in run:
+                result[run[command]] = None                                 # type: ignore
+            run[command] = len(result)
+        else:
+            run.clear()
+        result.append((command, value))
+
+    # запись значения, уже установленного на этом участке, не нужна
+    known: dict[COMMAND, int | str] = {}
+    optimized: list[tuple[COMMAND, int | str]] = []
+    for item in result:
+        if item is None:
+            continue
+        command, value = item
+        if command in _SETTERS:
+            if known.get(command) == value:
+                continue
+            known[command] = value
+        optimized.append(item)
+
+    return optimized
+
+
+def _fold_loops(block: list[tuple[COMMAND, int | str]]) -> list[tuple[COMMAND, int | str]]:
+    """Замена подряд идущих повторов последовательности команд циклом
+    LOOP_PROGRAM. Тело выполняется один раз, затем LOOP_PROGRAM
+    повторяет его ещё cycles раз.
+    """
+
+    result: list[tuple[COMMAND, int | str]] = []
+    index = 0
+    while index < len(block):
+        best_saved, best_size, best_count = 0, 0, 0
+        for size in range(1, min(_LOOP_BODY_MAX, (len(block) - index) // 2) + 1):
+            body = block[index:index + size]
+            if any(command in _CONTROL for command, _ in body):
+                break
+            count = 1
+            while count <= _LOOP_CYCLES_MAX and \
+                    block[index + count * size:index + (count + 1) * size] == body:
+                count += 1
+            saved = size * count - (size + 1)
+            if saved > best_saved:
+                best_saved, best_size, best_count = saved, size, count
+
+        if best_saved:
+            result.extend(block[index:index + best_size])
+            result.append((COMMAND.CMD_POWERSTEP01_LOOP_PROGRAM,
+                           (best_count - 1) << 10 | best_size))
+            index += best_size * best_count
+        else:
+            result.append(block[index])
+            index += 1
+
+    return result
+
+
+def optimize(commands: list[tuple[COMMAND, int | str]], labels: dict[str, int],
+             bank: int = 0) -> tuple[list[tuple[COMMAND, int | str]], dict[str, int],
+                                     OptimizationReport]:
+    """Оптимизация программы: удаление SET_WAIT(0), лишних записей
+    параметров, объединение перемещений в одном направлении и свёртка
+    повторов в циклы. Программа делится на линейные участки по меткам,
+    целям переходов и командам управления; тела существующих циклов
+    не изменяются. Возвращает новые команды, метки и отчёт.
+
+    Номера команд в переходах внутри банка bank пересчитываются. Переходы
+    в этот банк из программ других банков не видны и не пересчитываются,
+    поэтому при оптимизации программы, в которую есть такие переходы,
+    номера их команд нужно обновить отдельно.
+    """
+
+    targets = set(labels.values())
+    frozen: set[int] = set()
+    for index, (command, value) in enumerate(commands):
+        if command in _JUMPS and isinstance(value, int) and value >> 8 == bank:
+            if value & 0xFF > len(commands):
+                msg = "Jump target out of range"
+                raise SmsdError(msg)
+            targets.add(value & 0xFF)
+        elif command == COMMAND.CMD_POWERSTEP01_LOOP_PROGRAM and isinstance(value, int):
+            frozen.update(range(index - (value & _LOOP_COMMANDS_MAX), index + 1))
+
+    blocks: list[tuple[int, list[tuple[COMMAND, int | str]]]] = []
+    for index, item in enumerate(commands):
+        if not blocks or index in targets or index in frozen or index - 1 in frozen or \
+                commands[index - 1][0] in _CONTROL:
+            blocks.append((index, []))
+        blocks[-1][1].append(item)
+
+    optimized: list[tuple[COMMAND, int | str]] = []
+    starts: dict[int, int] = {}
+    for start, block in blocks:
+        starts[start] = len(optimized)
+        optimized.extend(block if start in frozen else _fold_loops(_peephole(block)))
+    starts[len(commands)] = len(optimized)
+
+    new_labels = {name: starts[index] for name, index in labels.items()}
+    for index, (command, value) in enumerate(optimized):
+        if command in _JUMPS and isinstance(value, int) and value >> 8 == bank:
+            optimized[index] = (command, bank << 8 | starts[value & 0xFF])  # type: ignore
+
+    report = OptimizationReport(len(commands), len(optimized),
+                                estimate_time(commands), estimate_time(optimized))
+    return optimized, new_labels, report
+
+
+class ProgramBuilder(Smsd):
+    """Запись команд Smsd в программу для банка памяти вместо их отправки.
+    Команды перехода принимают вместо номеров программы и команды имя
+    метки, объявленной методом label.
+
+    Пример:
+        builder = ProgramBuilder(bank=0)
+        builder.label("start")
+        builder.move_f(1000)
+        builder.set_wait(500)
+        builder.goto_program("start")
+        client.write_program(0, builder.build())
+    """
+
+    def __init__(self, bank: int = 0) -> None:
+        """Инициализация пустой программы для банка памяти bank."""
+
+        super().__init__(version=0)
+        self._program_command(CMD_TYPE.CODE_CMD_POWERSTEP01_W_MEM0, bank)
+        self.bank = bank
+        self.commands: list[tuple[COMMAND, int | str]] = []
+        self.labels: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.commands)
+
+    def _bus_exchange(self, packet: bytes) -> bytes:
+        """Обмен с устройством при записи программы невозможен."""
+
+        msg = "Command is not available in a program"
+        raise SmsdError(msg)
+
+    def _get_param(self, command: COMMAND, err_or_cmd: ERROR_OR_COMMAND) -> int:
+        """Чтение параметров при записи программы невозможно."""
+
+        msg = f"{command.name} is not available in a program"
+        raise SmsdError(msg)
+
+    def _set_param(self, command: COMMAND, err_or_cmd: ERROR_OR_COMMAND,
+                         value: int = 0) -> bool:
+        """Добавление команды в программу."""
+
+        if not _VALUE_MIN <= value <= _DATA_MASK:
+            msg = f"{command.name} value {value} is out of 22-bit range"
+            raise SmsdError(msg)
+
+        self.commands.append((command, value))
+        return True
+
+    def _jump(self, command: COMMAND, program: int | str, index: int) -> bool:
+        """Добавление команды перехода по метке или по номерам."""
+
+        if isinstance(program, str):
+            self.commands.append((command, program))
+            return True
+
+        if not 0 <= index < _COMMANDS_MAX:
+            msg = f"Command index {index} is out of range"
+            raise SmsdError(msg)
+
+        return self._set_param(command, ERROR_OR_COMMAND.OK, program << 8 | index)
+
+    def label(self, name: str) -> None:
+        """Объявление метки на следующей добавляемой команде."""
+
+        if name in self.labels:
+            msg = f"Duplicate label {name!r}"
+            raise SmsdError(msg)
+
+        self.labels[name] = len(self.commands)
+
+    def goto_program(self, program: int | str, command: int = 0) -> bool:     # type: ignore
+        """Безусловный переход к метке или к команде заданной программы."""
+
+        return self._jump(COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM, program, command)
+
+    def goto_program_if_in0(self, program: int | str, command: int = 0) -> bool:  # type: ignore
+        """Переход, если на входе IN0 присутствует сигнал."""
+
+        return self._jump(COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN0, program, command)
+
+    def goto_program_if_in1(self, program: int | str, command: int = 0) -> bool:  # type: ignore
+        """Переход, если на входе IN1 присутствует сигнал."""
+
+        return self._jump(COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN1, program, command)
+
+    def goto_program_if_zero(self, program: int | str, command: int = 0) -> bool:  # type: ignore
+        """Переход, если значение текущей позиции равно 0."""
+
+        return self._jump(COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_ZERO, program, command)
+
+    def goto_program_if_in_zero(self, program: int | str,                     # type: ignore
+                                      command: int = 0) -> bool:
+        """Переход, если на входе SET_ZERO присутствует сигнал."""
+
+        return self._jump(COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN_ZERO, program, command)
+
+    def call_program(self, program: int | str, command: int = 0) -> bool:    # type: ignore
+        """Вызов подпрограммы по метке или по номерам."""
+
+        return self._jump(COMMAND.CMD_POWERSTEP01_CALL_PROGRAM, program, command)
+
+    def resolve(self) -> list[tuple[COMMAND, int]]:
+        """Список команд с заменой меток на номера программы и команды."""
+
+        resolved = []
+        for command, value in self.commands:
+            if isinstance(value, str):
+                if value not in self.labels:
+                    msg = f"Undefined label {value!r}"
+                    raise SmsdError(msg)
+                if self.labels[value] >= _COMMANDS_MAX:
+                    msg = f"Label {value!r} is out of program range"
+                    raise SmsdError(msg)
+                value = self.bank << 8 | self.labels[value]
+            resolved.append((command, value))
+
+        return resolved
+
+    def build(self) -> array[int]:
+        """Получение программы в виде слов SMSD_CMD_TYPE. Команда
+        CMD_POWERSTEP01_END, которую добавляет program_image, учитывается в
+        ограничении длины программы.
+        """
+
+        size = len(self.commands)
+        if not self.commands or self.commands[-1][0] != COMMAND.CMD_POWERSTEP01_END:
+            size += 1
+        if size > _COMMANDS_MAX:
+            msg = f"Program exceeds {_COMMANDS_MAX} commands"
+            raise SmsdError(msg)
+
+        return array("I", [command_word(command, value) for command, value in self.resolve()])
+
+    def optimize(self) -> OptimizationReport:
+        """Оптимизация записанной программы (см. функцию optimize)."""
+
+        self.commands, self.labels, report = optimize(self.commands, self.labels, self.bank)
+        return report
+
+    def to_bytes(self) -> bytes:
+        """Получение образа программы для записи в банк памяти."""
+
+        return program_image(self.build())
+
+
+__all__ = ["COMMAND_TIME", "OptimizationReport", "ProgramBuilder", "estimate_time", "optimize"]
@@ -0,0 +1,229 @@
+#! /usr/bin/env python3
+
+"""Равномерный опрос показаний множества контроллеров SMSD-LAN."""
+
+from __future__ import annotations
+
+import logging
+from concurrent.futures import Future
+from heapq import heappop, heappush
+from itertools import count
+from threading import Condition, Lock, Thread
+from time import monotonic
+from types import MappingProxyType, TracebackType
+from typing import Any, Mapping
+
+from .smsd import Smsd, SmsdError
+from .telemetry import Reading
+from .worker import SmsdWorker
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+_GOLDEN = 0.6180339887498949    # сдвиг фаз опросов по золотому сечению
+_ADAPT_PERIOD = 1.0             # период пересчёта допустимой частоты, с
+_BUDGET_DECREASE = 0.8
+_BUDGET_INCREASE = 1.1
+_SCALE_MIN = 0.05               # наименьшая доля частоты опроса показания
+
+
+class _Poll:
+    """Опрос одного показания одного контроллера."""
+
+    __slots__ = ("controller", "future", "priority", "rate", "reading")
+
+    def __init__(self, controller: str, reading: str, rate: float, priority: int) -> None:
+        self.controller = controller
+        self.reading = reading
+        self.rate = rate
+        self.priority = priority
+        self.future: Future[Any] | None = None
+
+
+class PollScheduler:
+    """Опрос показаний группы контроллеров с заданными частотами. Опросы
+    упорядочиваются по сроку выполнения (earliest deadline first), их фазы
+    равномерно распределены во времени, а запросы передаются в потоки
+    ввода-вывода SmsdWorker.
+
+    Суммарная частота запросов ограничена budget в секунду. При превышении
+    сначала снижаются частоты показаний с большим номером priority (0 -
+    наивысший приоритет), но не ниже доли _SCALE_MIN от заданной. Если
+    контроллер не успевает ответить до следующего опроса, опрос
+    пропускается, а допустимая частота уменьшается до восстановления связи.
+
+    Последние показания публикуются в неизменяемом снимке snapshot:
+    snapshot[controller][reading] - Reading(value, time).
+    """
+
+    def __init__(self, workers: Mapping[str, SmsdWorker], budget: float = 200.0) -> None:
+        """Инициализация планировщика для потоков ввода-вывода контроллеров."""
+
+        self.workers = dict(workers)
+        self.budget = budget
+        self.effective_budget = budget
+        self.scales: dict[int, float] = {}
+        self.dispatched = 0
+        self.skipped = 0
+        self.errors = 0
+        self.snapshot: Mapping[str, Mapping[str, Reading]] = MappingProxyType({})
+        self._polls: list[_Poll] = []
+        self._heap: list[tuple[float, int, _Poll]] = []
+        self._seq = count()
+        self._ready = Condition()
+        self._publish_lock = Lock()     # снимок и счётчик errors из потоков ввода-вывода
+        self._running = False
+        self._thread: Thread | None = None
+        self._adapt_time = 0.0
+        self._adapt_skipped = 0
+
+    def add(self, controller: str, reading: str, rate: float, priority: int = 0) -> None:
+        """Добавление опроса показания reading (get_abs_pos,
+        get_status_in_event, get_speed, get_error_statistics и т.п.)
+        контроллера controller с частотой rate в секунду.
+        """
+
+        if controller not in self.workers:
+            msg = f"Unknown controller {controller}"
+            raise SmsdError(msg)
+        if not reading.startswith("get_") or not callable(getattr(Smsd, reading, None)):
+            msg = f"Unknown reading {reading}"
+            raise SmsdError(msg)
+        if rate <= 0:
+            msg = f"Invalid rate {rate} for {reading}"
+            raise SmsdError(msg)
+
+        poll = _Poll(controller, reading, rate, priority)
+        with self._ready:
+            self._polls.append(poll)
+            self._rescale()
+            if self._running:
+                self._push(monotonic() + self._phase(len(self._polls) - 1, poll), poll)
+                self._ready.notify()
+
+    def _phase(self, index: int, poll: _Poll) -> float:
+        """Начальный сдвиг опроса внутри его периода."""
+
+        return (index * _GOLDEN) % 1.0 / (poll.rate * self.scales[poll.priority])
+
+    def _push(self, due: float, poll: _Poll) -> None:
+        heappush(self._heap, (due, next(self._seq), poll))
+
+    def _rescale(self) -> None:
+        """Распределение допустимой частоты запросов по приоритетам."""
+
+        demand: dict[int, float] = {}
+        for poll in self._polls:
+            demand[poll.priority] = demand.get(poll.priority, 0.0) + poll.rate
+
+        remaining = self.effective_budget
+        for priority in sorted(demand):
+            scale = min(max(remaining / demand[priority], _SCALE_MIN), 1.0)
+            self.scales[priority] = scale
+            remaining = max(remaining - demand[priority] * scale, 0.0)
+
+    def _adapt(self, now: float) -> None:
+        """Изменение допустимой частоты по числу пропущенных опросов."""
+
+        if now - self._adapt_time < _ADAPT_PERIOD:
+            return
+
+        if self.skipped > self._adapt_skipped:
+            self.effective_budget *= _BUDGET_DECREASE
+        else:
+            self.effective_budget = min(self.effective_budget * _BUDGET_INCREASE, self.budget)
+        self._adapt_time = now
+        self._adapt_skipped = self.skipped
+        self._rescale()
+
+    def _dispatch(self, poll: _Poll) -> None:
+        """Передача запроса в поток ввода-вывода контроллера."""
+
+        if poll.future is not None and not poll.future.done():
+            self.skipped += 1
+            return
+
+        try:
+            poll.future = self.workers[poll.controller].submit(poll.reading)
+        except SmsdError as err:
+            with self._publish_lock:
+                self.errors += 1
+            _logger.debug("Poll %s.%s failed: %s", poll.controller, poll.reading, err)
+            return
+
+        self.dispatched += 1
+        poll.future.add_done_callback(lambda future: self._publish(poll, future))
+
+    def _publish(self, poll: _Poll, future: Future[Any]) -> None:
+        """Замена снимка новым с обновлённым показанием."""
+
+        if future.cancelled() or future.exception() is not None:
+            with self._publish_lock:
+                self.errors += 1
+            return
+
+        reading = Reading(future.result(), monotonic())
+        with self._publish_lock:
+            values = dict(self.snapshot.get(poll.controller, {}))
+            values[poll.reading] = reading
+            snapshot = dict(self.snapshot)
+            snapshot[poll.controller] = MappingProxyType(values)
+            self.snapshot = MappingProxyType(snapshot)
+
+    def _run(self) -> None:
+        while True:
+            with self._ready:
+                if not self._running:
+                    return
+                if not self._heap:
+                    self._ready.wait()
+                    continue
+                due, _, poll = self._heap[0]
+                now = monotonic()
+                if due > now:
+                    self._ready.wait(due - now)
+                    continue
+                heappop(self._heap)
+
+                self._dispatch(poll)
+                period = 1 / (poll.rate * self.scales[poll.priority])
+                self._push(max(due + period, now), poll)
+                self._adapt(now)
+
+    def start(self) -> None:
+        """Запуск потока планировщика."""
+
+        with self._ready:
+            if self._running:
+                return
+            now = monotonic()
+            self._running = True
+            self._adapt_time = now
+            self._heap.clear()
+            for index, poll in enumerate(self._polls):
+                self._push(now + self._phase(index, poll), poll)
+
+        self._thread = Thread(target=self._run, name="smsd-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Остановка потока планировщика."""
+
+        with self._ready:
+            self._running = False
+            self._ready.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self) -> PollScheduler:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                       exc_value: BaseException | None,
+                       traceback: TracebackType | None) -> None:
+        self.stop()
+
+
+__all__ = ["PollScheduler"]
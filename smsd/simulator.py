@@ -0,0 +1,225 @@
+#! /usr/bin/env python3
+
+"""Выполнение программ управления без контроллера и оценка их длительности."""
+
+from __future__ import annotations
+
+from array import array
+from itertools import repeat
+from sys import byteorder
+from typing import Iterable, Iterator, Mapping, NamedTuple, Union
+
+from .motion import MotionProfile
+from .program import COMMAND_TIME
+from .protocol import COMMAND
+from .smsd import _DATA_MASK, SmsdError, program_image, split_command_word
+
+_BANKS = {
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM0: 0,
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM1: 1,
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM2: 2,
+    COMMAND.CMD_POWERSTEP01_START_PROGRAM_MEM3: 3,
+}
+
+_SIGNALS = frozenset({
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN0,
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN1,
+    COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_IN_ZERO,
+})
+
+_WAITS = frozenset({
+    COMMAND.CMD_POWERSTEP01_WAIT_IN0,
+    COMMAND.CMD_POWERSTEP01_WAIT_IN1,
+    COMMAND.CMD_POWERSTEP01_WAIT_CONTINUE,
+    COMMAND.CMD_POWERSTEP01_GO_UNTIL_F,
+    COMMAND.CMD_POWERSTEP01_GO_UNTIL_R,
+    COMMAND.CMD_POWERSTEP01_SCAN_ZERO_F,
+    COMMAND.CMD_POWERSTEP01_SCAN_ZERO_R,
+    COMMAND.CMD_POWERSTEP01_SCAN_LABEL_F,
+    COMMAND.CMD_POWERSTEP01_SCAN_LABEL_R,
+    COMMAND.CMD_POWERSTEP01_SCAN_MARK2_F,
+    COMMAND.CMD_POWERSTEP01_SCAN_MARK2_R,
+    COMMAND.CMD_POWERSTEP01_GO_LABEL,
+})
+
+_GO_TO = frozenset({
+    COMMAND.CMD_POWERSTEP01_GO_TO,
+    COMMAND.CMD_POWERSTEP01_GO_TO_F,
+    COMMAND.CMD_POWERSTEP01_GO_TO_R,
+})
+
+_STOPS = frozenset({
+    COMMAND.CMD_POWERSTEP01_SOFT_STOP,
+    COMMAND.CMD_POWERSTEP01_HARD_STOP,
+    COMMAND.CMD_POWERSTEP01_SOFT_HI_Z,
+    COMMAND.CMD_POWERSTEP01_HARD_HI_Z,
+    COMMAND.CMD_POWERSTEP01_RESET_POWERSTEP01,
+})
+
+Script = Union[float, Iterable[float]]
+
+
+class SimulationResult(NamedTuple):
+    """Результат выполнения программы."""
+
+    time: float         # оценка длительности выполнения, с
+    commands: int       # количество выполненных команд
+    position: int       # конечное положение двигателя, шаги
+    running: bool       # двигатель вращается после RUN_F/RUN_R
+    finished: bool      # программа завершилась командой END или STOP_PROGRAM_MEM
+
+
+class Simulator:
+    """Интерпретатор программ управления, записанных в банки памяти.
+    Учитывает стек вызовов подпрограмм, счётчики циклов LOOP_PROGRAM и
+    длительность перемещений по трапециевидному профилю скорости, который
+    задаётся командами SET_MAX_SPEED, SET_MIN_SPEED, SET_ACC и SET_DEC
+    (начальный профиль - profile, по умолчанию MotionProfile()).
+    Длительность команд, ожидающих внешних сигналов, задаётся в waits (в
+    секундах), состояние входов для условных переходов - в signals. Значение
+    может быть числом или последовательностью значений для каждого
+    очередного выполнения команды; по умолчанию ожидание нулевое, а условие
+    перехода не выполняется. Программа, не завершившаяся за max_commands
+    команд, считается зациклившейся.
+    """
+
+    def __init__(self, banks: Mapping[int, Iterable[int] | bytes | bytearray | memoryview],
+                       waits: Mapping[COMMAND, Script] | None = None,
+                       signals: Mapping[COMMAND, bool | Iterable[bool]] | None = None,
+                       profile: MotionProfile | None = None,
+                       max_commands: int = 100000) -> None:
+        """Инициализация интерпретатора для программ банков памяти."""
+
+        self.banks: dict[int, list[tuple[COMMAND, int]]] = {}
+        for bank, program in banks.items():
+            words = array("I", program_image(program))
+            if byteorder == "big":
+                words.byteswap()
+            try:
+                self.banks[bank] = [split_command_word(word) for word in words]
+            except ValueError:
+                msg = f"Unknown command in program {bank}"
+                raise SmsdError(msg) from None
+
+        self.waits = dict(waits or {})
+        self.signals = dict(signals or {})
+        self.profile = MotionProfile() if profile is None else profile
+        self.max_commands = max_commands
+
+    @staticmethod
+    def _script(value: object) -> Iterator:
+        """Итератор значений сценария входных сигналов."""
+
+        if isinstance(value, (int, float)):
+            return repeat(value)
+        return iter(value)      # type: ignore
+
+    def _program(self, bank: int) -> list[tuple[COMMAND, int]]:
+        """Команды программы банка памяти."""
+
+        if bank not in self.banks:
+            msg = f"Program bank {bank} is empty"
+            raise SmsdError(msg)
+        return self.banks[bank]
+
+    def run(self, bank: int = 0, command: int = 0) -> SimulationResult:
+        """Выполнение программы с заданной команды заданного банка."""
+
+        waits = {key: self._script(value) for key, value in self.waits.items()}
+        signals = {key: self._script(value) for key, value in self.signals.items()}
+        profile = self.profile
+        move_time = profile.move_time
+        program = self._program(bank)
+
+        stack: list[tuple[int, int]] = []
+        loops: dict[tuple[int, int], int] = {}
+        elapsed = 0.0
+        position = 0
+        running = False
+        index = command
+
+        for executed in range(1, self.max_commands + 1):
+            if not 0 <= index < len(program):
+                msg = f"Jump outside of program {bank}: command {index}"
+                raise SmsdError(msg)
+
+            code, value = program[index]
+            elapsed += COMMAND_TIME
+            index += 1
+
+            if code == COMMAND.CMD_POWERSTEP01_END or \
+                    code == COMMAND.CMD_POWERSTEP01_STOP_PROGRAM_MEM:
+                return SimulationResult(elapsed, executed, position, running, True)
+            if code == COMMAND.CMD_POWERSTEP01_MOVE_F:
+                elapsed += move_time(value)
+                position += value
+            elif code == COMMAND.CMD_POWERSTEP01_MOVE_R:
+                elapsed += move_time(value)
+                position -= value
+            elif code in _GO_TO:
+                if value > _DATA_MASK >> 1:     # положение передаётся со знаком
+                    value -= _DATA_MASK + 1
+                elapsed += move_time(value - position)
+                position = value
+            elif code == COMMAND.CMD_POWERSTEP01_GO_ZERO:
+                elapsed += move_time(position)
+                position = 0
+            elif code == COMMAND.CMD_POWERSTEP01_RESET_POS:
+                position = 0
+            elif code == COMMAND.CMD_POWERSTEP01_SET_WAIT:
+                elapsed += value / 1000
+            elif code == COMMAND.CMD_POWERSTEP01_SET_WAIT_2:
+                script = waits.get(code)
+                elapsed += value / 1000 if script is None else \
+                           min(value / 1000, next(script, value / 1000))
+            elif code in _WAITS:
+                script = waits.get(code)
+                if script is not None:
+                    elapsed += next(script, 0.0)
+            elif code == COMMAND.CMD_POWERSTEP01_RUN_F or code == COMMAND.CMD_POWERSTEP01_RUN_R:
+                running = True
+            elif code in _STOPS:
+                running = False
+            elif code == COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED:
+                profile = profile._replace(max_speed=value)
+                move_time = profile.move_time
+            elif code == COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED:
+                profile = profile._replace(min_speed=value)
+                move_time = profile.move_time
+            elif code == COMMAND.CMD_POWERSTEP01_SET_ACC:
+                profile = profile._replace(acc=value)
+                move_time = profile.move_time
+            elif code == COMMAND.CMD_POWERSTEP01_SET_DEC:
+                profile = profile._replace(dec=value)
+                move_time = profile.move_time
+            elif code == COMMAND.CMD_POWERSTEP01_LOOP_PROGRAM:
+                key = (bank, index)
+                cycles = loops.get(key, value >> 10)
+                if cycles:
+                    loops[key] = cycles - 1
+                    index -= (value & 0x3FF) + 1
+                else:
+                    loops.pop(key, None)
+            elif code == COMMAND.CMD_POWERSTEP01_RETURN_PROGRAM:
+                if not stack:
+                    msg = f"Return without call in program {bank}"
+                    raise SmsdError(msg)
+                bank, index = stack.pop()
+                program = self._program(bank)
+            elif code in _BANKS:
+                stack.clear()
+                bank, index = _BANKS[code], 0       # type: ignore
+                program = self._program(bank)
+            elif code == COMMAND.CMD_POWERSTEP01_CALL_PROGRAM or \
+                    code == COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM or \
+                    code == COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM_IF_ZERO and not position or \
+                    code in _SIGNALS and next(signals.get(code, iter(())), False):
+                if code == COMMAND.CMD_POWERSTEP01_CALL_PROGRAM:
+                    stack.append((bank, index))
+                bank, index = value >> 8 & 0xFF, value & 0xFF
+                program = self._program(bank)
+
+        return SimulationResult(elapsed, self.max_commands, position, running, False)
+
+
+__all__ = ["SimulationResult", "Simulator"]
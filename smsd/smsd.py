@@ -4,19 +4,141 @@
 
 from __future__ import annotations
 
-from copy import deepcopy
-from ctypes import (POINTER, Array, Structure, byref, c_char, c_ubyte, cast,
-                    create_string_buffer, sizeof, string_at)
-from itertools import cycle
-from typing import NamedTuple
-
+import asyncio
+from array import array
+from concurrent.futures import Future
+from ctypes import (Array, Structure, byref, c_char, c_ubyte, create_string_buffer,
+                    sizeof, string_at)
+from sys import byteorder
+from threading import Lock
+from time import monotonic, sleep
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+from .core import (_COMMAND_SHIFT, _DATA_MASK, _DATA_SHIFT, _DATA_SIZE, FrameEncoder,
+                   SmsdConnectionError, SmsdError, _decode, checksum, payload)
+from .motion import MotionProfile
 from .protocol import (CMD_TYPE, COMMAND, COMMANDS_RETURN_DATA_TYPE, ERROR_OR_COMMAND,
-                       LAN_COMMAND_TYPE, LAN_ERROR_STATISTICS, MODE, SMSD_CMD_TYPE,
-                       SMSD_LAN_CONFIG_TYPE, STATUS_IN_EVENT)
+                       LAN_ERROR_STATISTICS, MODE, SMSD_CMD_TYPE, SMSD_LAN_CONFIG_TYPE,
+                       STATUS_IN_EVENT)
+
+
+_PROGRAM_BANKS = 4
+_WORD_SIZE = sizeof(SMSD_CMD_TYPE)
+
+_POLL_MIN = 0.005       # границы интервала опроса при ожидании, с
+_POLL_MAX = 0.25
+_ETA_MARGIN = 0.1       # доля прогнозируемой длительности, опрашиваемая заранее
+
+_PROFILE_FIELDS = {
+    COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED: "max_speed",
+    COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED: "min_speed",
+    COMMAND.CMD_POWERSTEP01_SET_ACC: "acc",
+    COMMAND.CMD_POWERSTEP01_SET_DEC: "dec",
+}
+
+_MOVES = frozenset({
+    COMMAND.CMD_POWERSTEP01_MOVE_F,
+    COMMAND.CMD_POWERSTEP01_MOVE_R,
+})
+
+_STOPS = frozenset({
+    COMMAND.CMD_POWERSTEP01_SOFT_STOP,
+    COMMAND.CMD_POWERSTEP01_HARD_STOP,
+    COMMAND.CMD_POWERSTEP01_SOFT_HI_Z,
+    COMMAND.CMD_POWERSTEP01_HARD_HI_Z,
+    COMMAND.CMD_POWERSTEP01_STOP_PROGRAM_MEM,
+})
+
+_CACHED_GETTERS = frozenset({
+    COMMAND.CMD_POWERSTEP01_GET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MIN_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MODE,
+})
+
+_CACHED = _CACHED_GETTERS | {
+    COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_ACC,
+    COMMAND.CMD_POWERSTEP01_SET_DEC,
+    COMMAND.CMD_POWERSTEP01_SET_FS_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_MODE,
+    COMMAND.CMD_POWERSTEP01_SET_MASK_EVENT,
+}
+
+# команды без побочного действия, одновременные запросы которых объединяются
+_READ_ONLY = frozenset({
+    COMMAND.CMD_POWERSTEP01_GET_SPEED,
+    COMMAND.CMD_POWERSTEP01_STATUS_IN_EVENT,
+    COMMAND.CMD_POWERSTEP01_GET_MODE,
+    COMMAND.CMD_POWERSTEP01_GET_ABS_POS,
+    COMMAND.CMD_POWERSTEP01_GET_EL_POS,
+    COMMAND.CMD_POWERSTEP01_GET_RELE,
+    COMMAND.CMD_POWERSTEP01_GET_MIN_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_STACK,
+})
+
+# записанное и прочитанное значения совпадают
+_CACHE_PAIRS = {
+    COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED: COMMAND.CMD_POWERSTEP01_GET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED: COMMAND.CMD_POWERSTEP01_GET_MIN_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MAX_SPEED: COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED,
+    COMMAND.CMD_POWERSTEP01_GET_MIN_SPEED: COMMAND.CMD_POWERSTEP01_SET_MIN_SPEED,
+}
+
+
+def command_word(command: COMMAND, value: int = 0) -> int:
+    """Упаковка команды и параметра в слово SMSD_CMD_TYPE."""
+
+    return command << _COMMAND_SHIFT | (value & _DATA_MASK) << _DATA_SHIFT
+
+
+def split_command_word(word: int) -> tuple[COMMAND, int]:
+    """Распаковка слова SMSD_CMD_TYPE на команду и параметр."""
+
+    return COMMAND(word >> _COMMAND_SHIFT & 0x3F), word >> _DATA_SHIFT
+
 
+def _is_end(word: int) -> bool:
+    """Проверка, является ли слово командой конца программы."""
 
-class SmsdError(Exception):
-    pass
+    return word >> _COMMAND_SHIFT & 0x3F == COMMAND.CMD_POWERSTEP01_END
+
+
+def _signed(value: int) -> int:
+    """Значение поля данных команды со знаком."""
+
+    return value - (_DATA_MASK + 1) if value > _DATA_MASK >> 1 else value
+
+
+def _poll_delay(eta: float | None, now: float, delay: float) -> float:
+    """Интервал до следующего опроса: при известном времени завершения -
+    половина оставшегося до него или прошедшего после него времени, иначе
+    предыдущий интервал, увеличенный вдвое.
+    """
+
+    delay = abs(eta - now) / 2 if eta is not None else delay * 2
+    return min(max(delay, _POLL_MIN), _POLL_MAX)
+
+
+def program_image(program: Iterable[int] | bytes | bytearray | memoryview) -> bytes:
+    """Формирование образа программы из слов SMSD_CMD_TYPE. Если программа не
+    заканчивается командой CMD_POWERSTEP01_END, команда добавляется в конец.
+    """
+
+    if isinstance(program, (bytes, bytearray, memoryview)):
+        words = array("I", bytes(program))
+        if byteorder == "big":
+            words.byteswap()
+    else:
+        words = array("I", program)
+
+    if not words or not _is_end(words[-1]):
+        words.append(command_word(COMMAND.CMD_POWERSTEP01_END))
+    if byteorder == "big":
+        words.byteswap()
+
+    return words.tobytes()
 
 
 IP4 = tuple[int, int, int, int]
@@ -33,59 +155,161 @@ class LAN_CONFIG(NamedTuple):
     DHCP: int
 
 
+class MOTOR_STATUS(NamedTuple):
+    HIZ: int
+    BUSY: int
+    SW_F: int
+    SW_EVN: int
+    DIR: int
+    MOT_STATUS: int
+    CMD_ERROR: int
+    TIME: float     # время получения ответа, monotonic()
+
+
 class Smsd:
     """Класс функций для работы с контроллером шагового двигателя SMSD-LAN."""
 
-    def __init__(self) -> None:
-        """Инициализация класса Smsd."""
+    def __init__(self, version: int | None = None) -> None:
+        """Инициализация класса Smsd. Если версия протокола не задана, она
+        запрашивается у устройства.
+        """
+
+        self._encoder = FrameEncoder()
+        self._status: tuple[int, float] | None = None
+        self.settings: dict[COMMAND, int] = {}
+        self._motion_eta: float | None = None
+        # время жизни значений в кэше параметров, с; None - кэш выключен.
+        # Запись уже записанного значения не выполняется, чтение скоростей
+        # и режима возвращает запомненное значение без обмена с устройством
+        self.cache_ttl: float | None = None
+        self._cache: dict[COMMAND, tuple[int, float]] = {}
+        self._inflight: dict[tuple[COMMAND, int], Future[Structure | None]] = {}
+        self._inflight_lock = Lock()
+        self._pause: Callable[[float], None] = sleep    # паузы между обменами
+        self.version = self.get_version() if version is None else version
+
+    @property
+    def version(self) -> int:
+        """Версия протокола, используемая в запросах."""
+
+        return self._encoder.version
 
-        self.version = self.get_version()
-        self.cmd_id = cycle(range(256))
+    @version.setter
+    def version(self, version: int) -> None:
+        self._encoder.version = version
+
+    @property
+    def cmd_id(self) -> Iterator[int]:
+        """Генератор номеров ID запросов (сохранён для совместимости)."""
+
+        return self._encoder.ids
 
     def _bus_exchange(self, packet: bytes) -> bytes:
         """Обмен по интерфейсу."""
 
         raise NotImplementedError
 
+    def _track(self, command: COMMAND, value: int, result: Structure) -> None:
+        """Учёт выполненной команды: запоминание параметров профиля скорости
+        и значений параметров в кэше, прогноз времени завершения перемещения
+        MOVE_F/MOVE_R.
+        """
+
+        if command in _PROFILE_FIELDS:
+            self.settings[command] = value
+        elif command in _MOVES:
+            self._motion_eta = monotonic() + self.motion_profile().move_time(value)
+        elif command == COMMAND.CMD_POWERSTEP01_RESET_POWERSTEP01:
+            self.settings.clear()
+            self._motion_eta = None
+            self.clear_cache()
+        elif command in _STOPS or self._is_idle(result):
+            self._motion_eta = None
+
+        if self.cache_ttl is not None and command in _CACHED:
+            entry = (int(result.RETURN_DATA) if command in _CACHED_GETTERS else value,
+                     monotonic())
+            self._cache[command] = entry
+            if command in _CACHE_PAIRS:
+                self._cache[_CACHE_PAIRS[command]] = entry
+            elif command == COMMAND.CMD_POWERSTEP01_SET_MODE:
+                self._cache.pop(COMMAND.CMD_POWERSTEP01_GET_MODE, None)
+
+    def _cached(self, command: COMMAND) -> int | None:
+        """Значение параметра из кэша, если кэш включён и значение не устарело."""
+
+        if self.cache_ttl is None or command not in self._cache:
+            return None
+
+        value, time = self._cache[command]
+        return value if monotonic() - time <= self.cache_ttl else None
+
+    def clear_cache(self) -> None:
+        """Сброс кэша параметров."""
+
+        self._cache.clear()
+
+    @property
+    def status(self) -> MOTOR_STATUS | None:
+        """Флаги POWERSTEP01 из последнего ответа устройства и время его
+        получения. Обновляются каждой командой без дополнительных запросов.
+        """
+
+        if self._status is None:
+            return None
+
+        word, time = self._status
+        return MOTOR_STATUS(HIZ=word & 1,
+                            BUSY=word >> 1 & 1,
+                            SW_F=word >> 2 & 1,
+                            SW_EVN=word >> 3 & 1,
+                            DIR=word >> 4 & 1,
+                            MOT_STATUS=word >> 5 & 3,
+                            CMD_ERROR=word >> 7 & 1,
+                            TIME=time)
+
+    def motion_profile(self) -> MotionProfile:
+        """Профиль скорости по значениям, записанным в устройство."""
+
+        return MotionProfile()._replace(**{field: self.settings[command]
+                                           for command, field in _PROFILE_FIELDS.items()
+                                           if command in self.settings})
+
     @staticmethod
-    def _checksum(data: list[int]) -> int:
+    def _is_idle(status: Structure) -> bool:
+        """Двигатель остановлен и устройство готово к следующей команде."""
+
+        return status.BUSY == 1 and status.MOT_STATUS == 0
+
+    @staticmethod
+    def _checksum(data: bytes | memoryview | list[int]) -> int:
         """Вычисление контрольной суммы."""
 
-        return -sum(data) & 0xFF
+        return checksum(data)
 
     def _make_request(self, command: CMD_TYPE, buffer: bytes) -> bytes:
         """Формирование пакета для записи."""
 
-        lan_command_type = LAN_COMMAND_TYPE()
-        lan_command_type.VER = self.version
-        lan_command_type.TYPE = command.value
-        lan_command_type.ID = next(self.cmd_id)
-        lan_command_type.LENGTH = len(buffer)
-        lan_command_type.DATA = (c_ubyte * 1024)(*buffer)
-        lan_command_type.XOR = self._checksum([lan_command_type.VER,
-                                               lan_command_type.TYPE,
-                                               lan_command_type.ID,
-                                               lan_command_type.LENGTH & 0xFF,
-                                               lan_command_type.LENGTH >> 8,
-                                              *lan_command_type.DATA[:lan_command_type.LENGTH]])
-        structure_lenght = 6 + lan_command_type.LENGTH
-        return string_at(byref(lan_command_type), structure_lenght)
-
-    def _parse_answer(self, buffer: bytes) -> Array[c_char]:
+        return self._encoder.request(command, buffer)
+
+    def _make_powerstep01_request(self, command: COMMAND, value: int) -> bytes:
+        """Формирование пакета команды POWERSTEP01 по готовому шаблону."""
+
+        return self._encoder.powerstep01(command, value)
+
+    def _parse_answer(self, buffer: bytes, ret_type: type[Structure]) -> Structure:
         """Расшифровка прочитанного пакета."""
 
-        lan_command_type = cast(create_string_buffer(buffer), POINTER(LAN_COMMAND_TYPE)).contents
-        xor = self._checksum([lan_command_type.VER,
-                              lan_command_type.TYPE,
-                              lan_command_type.ID,
-                              lan_command_type.LENGTH & 0xFF,
-                              lan_command_type.LENGTH >> 8,
-                             *lan_command_type.DATA[:lan_command_type.LENGTH]])
-        if xor != lan_command_type.XOR:
-            msg = "Invalid message checksum"
-            raise SmsdError(msg)
+        view = payload(buffer)
+        if ret_type is COMMANDS_RETURN_DATA_TYPE and len(view) >= 2:
+            self._status = (view[0] | view[1] << 8, monotonic())
+        return _decode(view, ret_type)
 
-        return create_string_buffer(bytes(lan_command_type.DATA[:lan_command_type.LENGTH]))
+    @staticmethod
+    def _payload(buffer: bytes) -> memoryview:
+        """Проверка прочитанного пакета и выделение информационной части."""
+
+        return payload(buffer)
 
     @staticmethod
     def _check_error(err_or_cmd: ERROR_OR_COMMAND, structure: Structure) -> None:
@@ -102,19 +326,29 @@ class Smsd:
 
         buffer = string_at(byref(data), sizeof(data))
         request = self._make_request(command, buffer)
+
+        return self._transfer(request, ret_type)
+
+    def _transfer(self, request: bytes, ret_type: type[Structure]) -> Structure:
+        """Отправка готового пакета и расшифровка ответа."""
+
         answer = self._bus_exchange(request)
-        ret_data = self._parse_answer(answer)
+        return self._parse_answer(answer, ret_type)
 
-        return cast(ret_data, POINTER(ret_type)).contents
+    @staticmethod
+    def _password_data(password: str) -> Array[c_ubyte]:
+        """Формирование поля данных команды авторизации."""
+
+        return (c_ubyte * 8)(*bytearray(password, encoding="ascii")[:8]) \
+               if password else \
+               (c_ubyte * 8)(*(0xEF, 0xCD, 0xAB, 0x89, 0x67, 0x45, 0x23, 0x01))
 
     def _password(self, command: CMD_TYPE, err_or_cmd: ERROR_OR_COMMAND,
                         password: str) -> bool:
         """Посылка команды авторизации в устройство."""
 
-        data = (c_ubyte * 8)(*bytearray(password, encoding="ascii")[:8]) \
-               if password else \
-               (c_ubyte * 8)(*(0xEF, 0xCD, 0xAB, 0x89, 0x67, 0x45, 0x23, 0x01))
-
+        self.clear_cache()
+        data = self._password_data(password)
         structure = self._execute(command, data, COMMANDS_RETURN_DATA_TYPE)
         self._check_error(err_or_cmd, structure)
 
@@ -124,26 +358,67 @@ class Smsd:
         """Посылка команды чтения настроек или статистики."""
 
         data = create_string_buffer(0)
-        result = self._execute(command, data, structure)
-
-        return deepcopy(result)
+        return self._execute(command, data, structure)
 
     def _powerstep01(self, command: COMMAND, value: int,
                      err_or_cmd: ERROR_OR_COMMAND) -> Structure:
-        """Посылка команды POWERSTEP01."""
+        """Посылка команды POWERSTEP01. Одновременные одинаковые запросы
+        чтения из разных потоков объединяются в один обмен с устройством,
+        результат или исключение которого получают все вызвавшие. Если обмен
+        прерван исключением, не являющимся Exception (например,
+        KeyboardInterrupt), ожидающие потоки выполняют запрос заново.
+        """
 
-        smsd_cmd_type = SMSD_CMD_TYPE()
-        smsd_cmd_type.COMMAND = command.value
-        smsd_cmd_type.DATA = value
+        if command not in _READ_ONLY:
+            return self._powerstep01_exchange(command, value, err_or_cmd)
+
+        key = (command, value)
+        while True:
+            with self._inflight_lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._inflight[key] = Future()
+                    break
+            # None - запрос прерван, ожидающие выполняют его заново
+            if (result := future.result()) is not None:
+                return result
+
+        try:
+            result = self._powerstep01_exchange(command, value, err_or_cmd)
+        except Exception as err:
+            self._inflight_done(key)
+            future.set_exception(err)
+            raise
+        except BaseException:
+            self._inflight_done(key)
+            future.set_result(None)
+            raise
+        self._inflight_done(key)
+        future.set_result(result)
+        return result
 
-        result = self._execute(CMD_TYPE.CODE_CMD_POWERSTEP01, smsd_cmd_type,
-                               COMMANDS_RETURN_DATA_TYPE)
+    def _inflight_done(self, key: tuple[COMMAND, int]) -> None:
+        """Завершение объединённого запроса: новые вызовы выполнят новый обмен."""
+
+        with self._inflight_lock:
+            del self._inflight[key]
+
+    def _powerstep01_exchange(self, command: COMMAND, value: int,
+                                    err_or_cmd: ERROR_OR_COMMAND) -> Structure:
+        """Обмен командой POWERSTEP01 с устройством."""
+
+        request = self._make_powerstep01_request(command, value)
+        result = self._transfer(request, COMMANDS_RETURN_DATA_TYPE)
         self._check_error(err_or_cmd, result)
+        self._track(command, value, result)
         return result
 
     def _get_param(self, command: COMMAND, err_or_cmd: ERROR_OR_COMMAND) -> int:
         """Чтение значения параметра из устройства."""
 
+        if (value := self._cached(command)) is not None:
+            return value
+
         structure = self._powerstep01(command, 0, err_or_cmd)
         return int(structure.RETURN_DATA)
 
@@ -151,9 +426,123 @@ class Smsd:
                          value: int = 0) -> bool:
         """Запись нового значения параметра в устройство."""
 
+        if self._cached(command) == value:
+            return True
+
         self._powerstep01(command, value, err_or_cmd)
         return True
 
+    @staticmethod
+    def _program_command(base: CMD_TYPE, bank: int) -> CMD_TYPE:
+        """Команда записи или чтения для указанного банка памяти."""
+
+        if not 0 <= bank < _PROGRAM_BANKS:
+            msg = f"Invalid program bank {bank}"
+            raise SmsdError(msg)
+
+        return CMD_TYPE(base + bank)
+
+    @staticmethod
+    def _program_frames(image: bytes) -> Iterator[tuple[bytes, bool]]:
+        """Разбиение образа программы на пакеты и признак последнего пакета."""
+
+        for offset in range(0, len(image), _DATA_SIZE):
+            yield image[offset:offset + _DATA_SIZE], offset + _DATA_SIZE >= len(image)
+
+    @staticmethod
+    def _check_program_write(structure: Structure, last: bool) -> None:
+        """Проверка ответа на пакет записи программы. Контроллер подтверждает
+        промежуточные пакеты кодом OK или NO_NEXT, последний - OK или
+        END_PROGRAMS.
+        """
+
+        allowed = (ERROR_OR_COMMAND.OK, ERROR_OR_COMMAND.END_PROGRAMS) if last else \
+                  (ERROR_OR_COMMAND.OK, ERROR_OR_COMMAND.NO_NEXT)
+        if structure.ERROR_OR_COMMAND not in allowed:
+            msg = f"{ERROR_OR_COMMAND(structure.ERROR_OR_COMMAND).name}"
+            raise SmsdError(msg)
+
+    @staticmethod
+    def _program_chunk(payload: memoryview) -> tuple[array[int], bool]:
+        """Разбор пакета, прочитанного из банка памяти: слова программы и
+        признак конца программы (неполный пакет). Ответ с длиной, не кратной
+        слову, содержит код статуса.
+        """
+
+        if len(payload) % _WORD_SIZE:
+            status = COMMANDS_RETURN_DATA_TYPE.from_buffer_copy(
+                            bytes(payload).ljust(sizeof(COMMANDS_RETURN_DATA_TYPE), b"\x00"))
+            if status.ERROR_OR_COMMAND in (ERROR_OR_COMMAND.END_PROGRAMS,
+                                           ERROR_OR_COMMAND.NO_NEXT):
+                return array("I"), True
+            msg = f"{ERROR_OR_COMMAND(status.ERROR_OR_COMMAND).name}"
+            raise SmsdError(msg)
+
+        words = array("I")
+        words.frombytes(payload)
+        if byteorder == "big":
+            words.byteswap()
+
+        return words, len(payload) < _DATA_SIZE
+
+    @staticmethod
+    def _program_trim(program: array[int]) -> array[int]:
+        """Удаление слов заполнения после последней команды
+        CMD_POWERSTEP01_END. Команды после первой команды END (например,
+        подпрограммы) сохраняются.
+        """
+
+        for index in range(len(program) - 1, -1, -1):
+            if _is_end(program[index]):
+                return program[:index + 1]
+
+        return program
+
+    @staticmethod
+    def _lan_config(lan_config: Structure) -> LAN_CONFIG:
+        """Преобразование структуры сетевых настроек SMSD_LAN_CONFIG_TYPE."""
+
+        return LAN_CONFIG(MAC=tuple(lan_config.MAC),
+                          IP=tuple(lan_config.IP),
+                          SN=tuple(lan_config.SN),
+                          GW=tuple(lan_config.GW),
+                          DNS=tuple(lan_config.DNS),
+                          PORT=lan_config.PORT,
+                          DHCP=lan_config.DHCP)
+
+    @staticmethod
+    def _make_lan_config(mac: IP6, ip: IP4, sn: IP4, gw: IP4, dns: IP4,
+                         port: int, dhcp: int) -> SMSD_LAN_CONFIG_TYPE:
+        """Формирование структуры сетевых настроек."""
+
+        lan_config = SMSD_LAN_CONFIG_TYPE()
+        lan_config.MAC = (c_ubyte * 6)(*mac)
+        lan_config.IP = (c_ubyte * 4)(*ip)
+        lan_config.SN = (c_ubyte * 4)(*sn)
+        lan_config.GW = (c_ubyte * 4)(*gw)
+        lan_config.DNS = (c_ubyte * 4)(*dns)
+        lan_config.PORT = port
+        lan_config.DHCP = dhcp
+        return lan_config
+
+    @staticmethod
+    def _rele_state(err: SmsdError) -> int:
+        """Определение состояния реле по коду ответа."""
+
+        if str(err) == "STATUS_RELE_CLR":
+            return 0
+        if str(err) == "STATUS_RELE_SET":
+            return 1
+
+        raise SmsdError from err
+
+    @staticmethod
+    def _stack(result: int) -> dict[str, int]:
+        """Разбор информации о выполняемой программе."""
+
+        return {"command": result & 0xFF,
+                "program": result >> 8 & 0x3}
+
     # Основные функции
 
     def get_version(self) -> int:
@@ -188,27 +577,13 @@ class Smsd:
 
         lan_config = self._config_or_stats(CMD_TYPE.CODE_CMD_CONFIG_GET,
                                            SMSD_LAN_CONFIG_TYPE)
-        return LAN_CONFIG(MAC=tuple(lan_config.MAC),
-                          IP=tuple(lan_config.IP),
-                          SN=tuple(lan_config.SN),
-                          GW=tuple(lan_config.GW),
-                          DNS=tuple(lan_config.DNS),
-                          PORT=lan_config.PORT,
-                          DHCP=lan_config.DHCP)
+        return self._lan_config(lan_config)
 
     def set_lan_config(self, mac: IP6, ip: IP4, sn: IP4, gw: IP4, dns: IP4,
                              port: int, dhcp: int) -> bool:
         """Запись новых сетевых настроек."""
 
-        lan_config = SMSD_LAN_CONFIG_TYPE()
-        lan_config.MAC = (c_ubyte * 6)(*mac)
-        lan_config.IP = (c_ubyte * 4)(*ip)
-        lan_config.SN = (c_ubyte * 4)(*sn)
-        lan_config.GW = (c_ubyte * 4)(*gw)
-        lan_config.DNS = (c_ubyte * 4)(*dns)
-        lan_config.PORT = port
-        lan_config.DHCP = dhcp
-
+        lan_config = self._make_lan_config(mac, ip, sn, gw, dns, port, dhcp)
         structure = self._execute(CMD_TYPE.CODE_CMD_CONFIG_SET, lan_config,
                                   COMMANDS_RETURN_DATA_TYPE)
         self._check_error(ERROR_OR_COMMAND.OK, structure)
@@ -509,10 +884,7 @@ class Smsd:
             self._get_param(COMMAND.CMD_POWERSTEP01_GET_RELE,
                             ERROR_OR_COMMAND.OK)
         except SmsdError as err:
-            if str(err) == "STATUS_RELE_CLR":
-                return 0
-            if str(err) == "STATUS_RELE_SET":
-                return 1
+            return self._rele_state(err)
 
         raise SmsdError
 
@@ -547,8 +919,7 @@ class Smsd:
 
         result = self._get_param(COMMAND.CMD_POWERSTEP01_GET_STACK,
                                  ERROR_OR_COMMAND.COMMAND_GET_STACK)
-        return {"command": result & 0xFF,
-                "program": result >> 8 & 0x3}
+        return self._stack(result)
 
     def wait_continue(self) -> bool:
         """Ожидание прихода синхросигнала на вход CONTINUE."""
@@ -672,5 +1043,365 @@ class Smsd:
                                ERROR_OR_COMMAND.OK,
                                cycles << 10 | commands)
 
+    # Программы управления
+
+    def write_program(self, bank: int,
+                            program: Iterable[int] | bytes | bytearray | memoryview) -> bool:
+        """Запись программы управления в банк памяти 0..3. Программа задаётся
+        словами SMSD_CMD_TYPE (см. command_word) или готовым образом и
+        передаётся пакетами по 256 команд.
+        """
+
+        command = self._program_command(CMD_TYPE.CODE_CMD_POWERSTEP01_W_MEM0, bank)
+        for data, last in self._program_frames(program_image(program)):
+            self._pause(0.0)
+            structure = self._transfer(self._make_request(command, data),
+                                       COMMANDS_RETURN_DATA_TYPE)
+            self._check_program_write(structure, last)
+
+        return True
+
+    def read_program(self, bank: int) -> array[int]:
+        """Чтение программы управления из банка памяти 0..3 в виде слов
+        SMSD_CMD_TYPE (см. split_command_word).
+        """
+
+        command = self._program_command(CMD_TYPE.CODE_CMD_POWERSTEP01_R_MEM0, bank)
+        program = array("I")
+        finished = False
+        while not finished:
+            self._pause(0.0)
+            answer = self._bus_exchange(self._make_request(command, b""))
+            words, finished = self._program_chunk(self._payload(answer))
+            program.extend(words)
+
+        return self._program_trim(program)
+
+    # Ожидание завершения движения
+
+    @staticmethod
+    def _first_poll(expected: float | None, now: float, limit: float | None) -> float:
+        """Пауза до первого опроса: немного раньше прогнозируемого времени."""
+
+        lead = 0.0 if expected is None else (expected - now) * (1 - _ETA_MARGIN) - _POLL_MIN
+        return max(lead if limit is None else min(lead, limit - now), 0.0)
+
+    def _wait(self, done: Callable[[Structure], bool],
+                    eta: Callable[[float, Structure | None], float | None],
+                    timeout: float | None) -> bool:
+        """Опрос положения двигателя до выполнения условия done. Интервал
+        опроса сокращается по мере приближения к прогнозу eta.
+        """
+
+        now = monotonic()
+        limit = None if timeout is None else now + timeout
+        self._pause(self._first_poll(eta(now, None), now, limit))
+
+        delay = _POLL_MIN / 2
+        while True:
+            status = self._powerstep01(COMMAND.CMD_POWERSTEP01_GET_ABS_POS, 0,
+                                       ERROR_OR_COMMAND.COMMAND_GET_ABS_POS)
+            if done(status):
+                return True
+
+            now = monotonic()
+            if limit is not None and now >= limit:
+                return False
+            delay = _poll_delay(eta(now, status), now, delay)
+            self._pause(delay if limit is None else min(delay, limit - now))
+
+    def _idle_waiter(self) -> Callable[[float, Structure | None], float | None]:
+        """Прогноз завершения последнего перемещения MOVE_F/MOVE_R. Прогноз
+        сбрасывается командами остановки и ответом об остановке двигателя.
+        """
+
+        return lambda now, status: self._motion_eta
+
+    @staticmethod
+    def _position_waiter(position: int) -> Callable[[float, Structure | None], float | None]:
+        """Прогноз достижения положения по скорости между двумя опросами."""
+
+        samples: list[tuple[float, int]] = []
+
+        def eta(now: float, status: Structure | None) -> float | None:
+            if status is None:
+                return None
+            samples.append((now, _signed(status.RETURN_DATA)))
+            if len(samples) < 2:
+                return None
+            (time_0, pos_0), (time_1, pos_1) = samples[-2:]
+            del samples[0]
+            speed = (pos_1 - pos_0) / (time_1 - time_0) if time_1 > time_0 else 0
+            if not speed or (position - pos_1) / speed < 0:
+                return None
+            return time_1 + (position - pos_1) / speed
+
+        return eta
+
+    def wait_until_idle(self, timeout: float | None = None) -> bool:
+        """Ожидание остановки двигателя. Время завершения перемещения
+        MOVE_F/MOVE_R прогнозируется по записанным скорости и ускорению,
+        до этого момента устройство не опрашивается. Возвращает False,
+        если двигатель не остановился за timeout секунд.
+        """
+
+        return self._wait(self._is_idle, self._idle_waiter(), timeout)
+
+    def wait_for_position(self, position: int, tolerance: int = 0,
+                                timeout: float | None = None) -> bool:
+        """Ожидание достижения двигателем положения position с точностью
+        tolerance шагов. Возвращает False, если положение не достигнуто за
+        timeout секунд.
+        """
+
+        return self._wait(lambda status: abs(_signed(status.RETURN_DATA) - position) <= tolerance,
+                          self._position_waiter(position), timeout)
+
+
+class AsyncSmsd(Smsd):
+    """Класс функций для работы с контроллером SMSD-LAN в виде сопрограмм.
+    Вспомогательные методы класса Smsd переопределены сопрограммами, поэтому
+    основные функции возвращают объекты, которые нужно ожидать через await.
+    """
+
+    def __init__(self, version: int) -> None:
+        """Инициализация класса AsyncSmsd с известной версией протокола."""
+
+        self._async_inflight: dict[tuple[COMMAND, int], asyncio.Future[Structure | None]] = {}
+        super().__init__(version)
+
+    async def _bus_exchange(self, packet: bytes) -> bytes:     # type: ignore
+        """Обмен по интерфейсу."""
+
+        raise NotImplementedError
+
+    async def _execute(self, command: CMD_TYPE,                # type: ignore
+                             data: SMSD_CMD_TYPE | SMSD_LAN_CONFIG_TYPE | Array[c_ubyte] | Array[c_char],
+                             ret_type: type[Structure]) -> Structure:
+        """Выполнение команды и получение ответа."""
+
+        buffer = string_at(byref(data), sizeof(data))
+        request = self._make_request(command, buffer)
+
+        return await self._transfer(request, ret_type)
+
+    async def _transfer(self, request: bytes,                  # type: ignore
+                              ret_type: type[Structure]) -> Structure:
+        """Отправка готового пакета и расшифровка ответа."""
+
+        answer = await self._bus_exchange(request)
+        return self._parse_answer(answer, ret_type)
+
+    async def _config_or_stats(self, command: CMD_TYPE,        # type: ignore
+                                     structure: type[Structure]) -> Structure:
+        """Посылка команды чтения настроек или статистики."""
+
+        data = create_string_buffer(0)
+        return await self._execute(command, data, structure)
+
+    async def _password(self, command: CMD_TYPE,               # type: ignore
+                              err_or_cmd: ERROR_OR_COMMAND, password: str) -> bool:
+        """Посылка команды авторизации в устройство."""
+
+        self.clear_cache()
+        data = self._password_data(password)
+        structure = await self._execute(command, data, COMMANDS_RETURN_DATA_TYPE)
+        self._check_error(err_or_cmd, structure)
+
+        return True
+
+    async def _powerstep01(self, command: COMMAND, value: int,  # type: ignore
+                                 err_or_cmd: ERROR_OR_COMMAND) -> Structure:
+        """Посылка команды POWERSTEP01. Одновременные одинаковые запросы
+        чтения ожидают результата одного обмена с устройством.
+        """
+
+        if command not in _READ_ONLY:
+            return await self._powerstep01_exchange(command, value, err_or_cmd)
+
+        key = (command, value)
+        while (waiter := self._async_inflight.get(key)) is not None:
+            # None - запрос отменён, ожидающие выполняют его заново
+            if (result := await self._await_waiter(waiter)) is not None:
+                return result
+
+        waiter = self._async_inflight[key] = self._create_waiter()
+        try:
+            result = await self._powerstep01_exchange(command, value, err_or_cmd)
+        except Exception as err:
+            del self._async_inflight[key]
+            waiter.set_exception(err)
+            waiter.exception()      # исключение может быть никем не ожидаемо
+            raise
+        except BaseException:
+            del self._async_inflight[key]
+            waiter.set_result(None)
+            raise
+        del self._async_inflight[key]
+        waiter.set_result(result)
+        return result
+
+    def _create_waiter(self) -> asyncio.Future[Structure | None]:
+        """Общий результат объединённого запроса чтения. Клиенты, которые
+        выполняются без цикла событий asyncio, переопределяют этот метод
+        вместе с _await_waiter.
+        """
+
+        return asyncio.get_running_loop().create_future()
+
+    async def _await_waiter(self, waiter: asyncio.Future[Structure | None]) -> Structure | None:
+        """Ожидание общего результата. Отмена ожидающей сопрограммы не
+        отменяет запрос, результат которого ждут другие.
+        """
+
+        return await asyncio.shield(waiter)
+
+    async def _powerstep01_exchange(self, command: COMMAND,    # type: ignore
+                                          value: int,
+                                          err_or_cmd: ERROR_OR_COMMAND) -> Structure:
+        """Обмен командой POWERSTEP01 с устройством."""
+
+        request = self._make_powerstep01_request(command, value)
+        result = await self._transfer(request, COMMANDS_RETURN_DATA_TYPE)
+        self._check_error(err_or_cmd, result)
+        self._track(command, value, result)
+        return result
+
+    async def _get_param(self, command: COMMAND,               # type: ignore
+                               err_or_cmd: ERROR_OR_COMMAND) -> int:
+        """Чтение значения параметра из устройства."""
+
+        if (value := self._cached(command)) is not None:
+            return value
+
+        structure = await self._powerstep01(command, 0, err_or_cmd)
+        return int(structure.RETURN_DATA)
+
+    async def _set_param(self, command: COMMAND,               # type: ignore
+                               err_or_cmd: ERROR_OR_COMMAND, value: int = 0) -> bool:
+        """Запись нового значения параметра в устройство."""
+
+        if self._cached(command) == value:
+            return True
+
+        await self._powerstep01(command, value, err_or_cmd)
+        return True
+
+    async def get_version(self) -> int:                        # type: ignore
+        """Получение версии протокола."""
+
+        if answer := await self._bus_exchange(b""):
+            return answer[1]
+
+        msg = "Get protocol version error"
+        raise SmsdError(msg)
+
+    async def get_lan_config(self) -> LAN_CONFIG:              # type: ignore
+        """Чтение текущих сетевых настроек."""
+
+        lan_config = await self._config_or_stats(CMD_TYPE.CODE_CMD_CONFIG_GET,
+                                                 SMSD_LAN_CONFIG_TYPE)
+        return self._lan_config(lan_config)
+
+    async def set_lan_config(self, mac: IP6, ip: IP4, sn: IP4,  # type: ignore
+                                   gw: IP4, dns: IP4, port: int, dhcp: int) -> bool:
+        """Запись новых сетевых настроек."""
+
+        lan_config = self._make_lan_config(mac, ip, sn, gw, dns, port, dhcp)
+        structure = await self._execute(CMD_TYPE.CODE_CMD_CONFIG_SET, lan_config,
+                                        COMMANDS_RETURN_DATA_TYPE)
+        self._check_error(ERROR_OR_COMMAND.OK, structure)
+
+        return True
+
+    async def get_mode(self) -> MODE:                          # type: ignore
+        """Чтение настроек управления двигателем."""
+
+        mode = MODE()
+        mode.as_byte = await self._get_param(COMMAND.CMD_POWERSTEP01_GET_MODE,
+                                             ERROR_OR_COMMAND.COMMAND_GET_MODE)
+        return mode
+
+    async def get_status_in_event(self) -> STATUS_IN_EVENT:    # type: ignore
+        """Чтение текущего состояния входных сигналов."""
+
+        status = STATUS_IN_EVENT()
+        status.as_byte = await self._get_param(COMMAND.CMD_POWERSTEP01_STATUS_IN_EVENT,
+                                               ERROR_OR_COMMAND.COMMAND_GET_STATUS_IN_EVENT)
+        return status
+
+    async def get_rele(self) -> int:                           # type: ignore
+        """Запрос состояния реле контроллера."""
+
+        try:
+            await self._get_param(COMMAND.CMD_POWERSTEP01_GET_RELE,
+                                  ERROR_OR_COMMAND.OK)
+        except SmsdError as err:
+            return self._rele_state(err)
+
+        raise SmsdError
+
+    async def get_stack(self) -> dict[str, int]:               # type: ignore
+        """Чтение информации о выполняемой в данный момент программе."""
+
+        result = await self._get_param(COMMAND.CMD_POWERSTEP01_GET_STACK,
+                                       ERROR_OR_COMMAND.COMMAND_GET_STACK)
+        return self._stack(result)
+
+    async def write_program(self, bank: int,                   # type: ignore
+                                  program: Iterable[int] | bytes | bytearray | memoryview) -> bool:
+        """Запись программы управления в банк памяти 0..3."""
+
+        command = self._program_command(CMD_TYPE.CODE_CMD_POWERSTEP01_W_MEM0, bank)
+        for data, last in self._program_frames(program_image(program)):
+            structure = await self._transfer(self._make_request(command, data),
+                                             COMMANDS_RETURN_DATA_TYPE)
+            self._check_program_write(structure, last)
+
+        return True
+
+    async def read_program(self, bank: int) -> array[int]:     # type: ignore
+        """Чтение программы управления из банка памяти 0..3."""
+
+        command = self._program_command(CMD_TYPE.CODE_CMD_POWERSTEP01_R_MEM0, bank)
+        program = array("I")
+        finished = False
+        while not finished:
+            answer = await self._bus_exchange(self._make_request(command, b""))
+            words, finished = self._program_chunk(self._payload(answer))
+            program.extend(words)
+
+        return self._program_trim(program)
+
+    # Ожидание завершения движения
+
+    async def _sleep(self, delay: float) -> None:
+        """Пауза между опросами."""
+
+        await asyncio.sleep(delay)
+
+    async def _wait(self, done: Callable[[Structure], bool],   # type: ignore
+                          eta: Callable[[float, Structure | None], float | None],
+                          timeout: float | None) -> bool:
+        """Опрос положения двигателя до выполнения условия done."""
+
+        now = monotonic()
+        limit = None if timeout is None else now + timeout
+        await self._sleep(self._first_poll(eta(now, None), now, limit))
+
+        delay = _POLL_MIN / 2
+        while True:
+            status = await self._powerstep01(COMMAND.CMD_POWERSTEP01_GET_ABS_POS, 0,
+                                             ERROR_OR_COMMAND.COMMAND_GET_ABS_POS)
+            if done(status):
+                return True
+
+            now = monotonic()
+            if limit is not None and now >= limit:
+                return False
+            delay = _poll_delay(eta(now, status), now, delay)
+            await self._sleep(delay if limit is None else min(delay, limit - now))
+
 
-__all__ = ["Smsd"]
+__all__ = ["AsyncSmsd", "Smsd", "SmsdConnectionError", "SmsdError", "command_word",
+           "program_image", "split_command_word"]
@@ -0,0 +1,227 @@
+#! /usr/bin/env python3
+
+"""Фоновый опрос показаний контроллера SMSD-LAN."""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from math import inf
+from threading import Event, Lock, Thread
+from time import monotonic
+from types import MappingProxyType, TracebackType
+from typing import Any, Mapping, NamedTuple
+
+from .smsd import AsyncSmsd, Smsd, SmsdError
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+_READINGS = {
+    "get_abs_pos": 0.05,
+    "get_speed": 0.1,
+    "get_status_in_event": 0.1,
+}
+
+
+class Reading(NamedTuple):
+    """Показание и время его получения (monotonic)."""
+
+    value: Any
+    time: float
+
+
+class TelemetryPoller:
+    """Опрос показаний в отдельном потоке. readings задаёт имена методов
+    чтения (get_abs_pos, get_speed и т.п.) и период их опроса в секундах;
+    если суммарная частота запросов превышает max_rate в секунду, периоды
+    пропорционально увеличиваются. Последние показания публикуются в
+    неизменяемом снимке snapshot, который читается без обмена с устройством
+    и без блокировок. Другие потоки, работающие с тем же клиентом, должны
+    выполнять команды под блокировкой lock либо использовать клиент через
+    SmsdWorker, переданный вместо клиента. Ошибки опроса учитываются в
+    errors и last_error, опрос при этом продолжается.
+    """
+
+    def __init__(self, client: Smsd, readings: Mapping[str, float] | None = None,
+                       max_rate: float = 50.0) -> None:
+        """Инициализация опроса показаний клиента."""
+
+        readings = dict(_READINGS if readings is None else readings)
+        for name, period in readings.items():
+            if not name.startswith("get_") or not callable(getattr(Smsd, name, None)):
+                msg = f"Unknown reading {name}"
+                raise SmsdError(msg)
+            if period <= 0:
+                msg = f"Invalid period {period} for {name}"
+                raise SmsdError(msg)
+
+        rate = sum(1 / period for period in readings.values())
+        scale = max(rate / max_rate, 1.0)
+
+        self.client = client
+        self.periods = {name: period * scale for name, period in readings.items()}
+        self.interval = 1 / max_rate
+        self.lock = Lock()
+        self.errors = 0
+        self.last_error: Exception | None = None
+        self.snapshot: Mapping[str, Reading] = MappingProxyType({})
+        self._due: dict[str, float] = {}
+        self._allowed = 0.0
+        self._stop = Event()
+        self._thread: Thread | None = None
+
+    def age(self, name: str) -> float:
+        """Время, прошедшее с получения показания, или inf."""
+
+        reading = self.snapshot.get(name)
+        return inf if reading is None else monotonic() - reading.time
+
+    def _reset(self) -> None:
+        """Начальное расписание: опросы разнесены на минимальный интервал."""
+
+        now = monotonic()
+        self._due = {name: now + index * self.interval
+                     for index, name in enumerate(self.periods)}
+
+    def _next(self) -> tuple[str, float]:
+        """Ближайшее по времени показание и время его опроса не раньше, чем
+        через минимальный интервал после предыдущего запроса.
+        """
+
+        name, due = min(self._due.items(), key=lambda item: item[1])
+        return name, max(due, self._allowed)
+
+    def _publish(self, name: str, value: Any, now: float) -> None:
+        """Замена снимка новым с обновлённым показанием."""
+
+        values = dict(self.snapshot)
+        values[name] = Reading(value, now)
+        status = self.client.status
+        if status is not None:
+            values["status"] = Reading(status, status.TIME)
+        self.snapshot = MappingProxyType(values)
+
+    def _schedule(self, name: str, now: float) -> None:
+        """Время следующего опроса без накопления пропущенных."""
+
+        self._due[name] = max(self._due[name] + self.periods[name], now)
+        self._allowed = now + self.interval
+
+    def _error(self, err: Exception) -> None:
+        """Учёт ошибки опроса; прежнее показание сохраняется, опрос
+        продолжается.
+        """
+
+        self.errors += 1
+        self.last_error = err
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            name, due = self._next()
+            if self._stop.wait(max(due - monotonic(), 0.0)):
+                break
+
+            try:
+                with self.lock:
+                    value = getattr(self.client, name)()
+            except Exception as err:
+                _logger.debug("Poll %s failed", name, exc_info=True)
+                self._error(err)
+            else:
+                self._publish(name, value, monotonic())
+            self._schedule(name, monotonic())
+
+    def start(self) -> None:
+        """Запуск потока опроса."""
+
+        if self._thread is not None:
+            return
+
+        self._stop.clear()
+        self._reset()
+        self._thread = Thread(target=self._run, name="smsd-telemetry", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Остановка потока опроса."""
+
+        if self._thread is None:
+            return
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self) -> TelemetryPoller:
+        self.start()
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                       exc_value: BaseException | None,
+                       traceback: TracebackType | None) -> None:
+        self.stop()
+
+
+class AsyncTelemetryPoller(TelemetryPoller):
+    """Опрос показаний асинхронного клиента в задаче asyncio. Блокировка не
+    нужна: асинхронный клиент допускает одновременные команды.
+    """
+
+    client: AsyncSmsd
+
+    def __init__(self, client: AsyncSmsd, readings: Mapping[str, float] | None = None,
+                       max_rate: float = 50.0) -> None:
+        """Инициализация опроса показаний асинхронного клиента."""
+
+        super().__init__(client, readings, max_rate)
+        self._task: asyncio.Task[None] | None = None
+
+    async def _poll(self) -> None:
+        while True:
+            name, due = self._next()
+            await asyncio.sleep(max(due - monotonic(), 0.0))
+
+            try:
+                value = await getattr(self.client, name)()
+            except Exception as err:
+                _logger.debug("Poll %s failed", name, exc_info=True)
+                self._error(err)
+            else:
+                self._publish(name, value, monotonic())
+            self._schedule(name, monotonic())
+
+    def start(self) -> None:
+        """Запуск задачи опроса в текущем цикле событий."""
+
+        if self._task is None:
+            self._reset()
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self) -> None:                               # type: ignore
+        """Остановка задачи опроса."""
+
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        with suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    def __enter__(self) -> AsyncTelemetryPoller:
+        msg = "Use 'async with' for AsyncTelemetryPoller"
+        raise SmsdError(msg)
+
+    async def __aenter__(self) -> AsyncTelemetryPoller:
+        self.start()
+        return self
+
+    async def __aexit__(self, exc_type: type[BaseException] | None,
+                              exc_value: BaseException | None,
+                              traceback: TracebackType | None) -> None:
+        await self.stop()
+
+
+__all__ = ["AsyncTelemetryPoller", "Reading", "TelemetryPoller"]
@@ -0,0 +1,176 @@
+#! /usr/bin/env python3
+
+"""Потокобезопасная работа с контроллером SMSD-LAN через поток ввода-вывода."""
+
+from __future__ import annotations
+
+import logging
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Thread, get_ident
+from time import monotonic, sleep
+from types import TracebackType
+from typing import Any, NamedTuple
+
+from .smsd import Smsd, SmsdError
+
+_logger = logging.getLogger(__name__)
+_logger.addHandler(logging.NullHandler())
+
+PRIORITY_STOP = 0
+PRIORITY_NORMAL = 1
+
+_STOPS = frozenset({"hard_stop", "soft_stop", "hard_hi_z", "soft_hi_z", "stop_program_mem"})
+_LATENCY_SAMPLES = 1000
+
+
+class LatencyStats(NamedTuple):
+    """Время ожидания команд остановки в очереди, с."""
+
+    samples: int
+    mean: float
+    p99: float
+    max: float
+
+
+class SmsdWorker:
+    """Клиент, которым владеет отдельный поток ввода-вывода. Команды из
+    любых потоков ставятся в очередь методом submit и выполняются по одной,
+    поэтому пакеты разных команд не перемешиваются. Методы клиента
+    доступны как блокирующие обёртки над submit: worker.get_abs_pos().
+    Каждому контроллеру соответствует свой поток, поэтому команды разных
+    контроллеров друг друга не ждут.
+
+    Команды остановки (hard_stop, soft_stop, hard_hi_z, soft_hi_z,
+    stop_program_mem) выполняются раньше всех команд в очереди, а также
+    между пакетами записи и чтения программы и во время пауз ожидания
+    wait_until_idle и wait_for_position.
+    """
+
+    def __init__(self, client: Smsd) -> None:
+        """Запуск потока ввода-вывода для клиента."""
+
+        self.client = client
+        self.stop_latency: deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._lanes: tuple[deque, deque] = (deque(), deque())
+        self._ready = Condition()
+        self._thread = Thread(target=self._run, name="smsd-worker", daemon=True)
+        self._closed = False
+        client._pause = self._pause
+        self._thread.start()
+
+    def _take(self, lanes: tuple[int, ...], timeout: float | None) -> tuple | None:
+        """Получение команды из очередей lanes в порядке приоритета."""
+
+        with self._ready:
+            self._ready.wait_for(lambda: any(self._lanes[lane] for lane in lanes), timeout)
+            for lane in lanes:
+                if self._lanes[lane]:
+                    return self._lanes[lane].popleft()
+        return None
+
+    def _execute(self, item: tuple) -> None:
+        """Выполнение команды в потоке ввода-вывода."""
+
+        future, name, args, kwargs, priority, submitted = item
+        if not future.set_running_or_notify_cancel():
+            return
+        if priority == PRIORITY_STOP:
+            self.stop_latency.append(monotonic() - submitted)
+        try:
+            result = getattr(self.client, name)(*args, **kwargs)
+        except BaseException as err:
+            _logger.debug("Command %s failed", name, exc_info=True)
+            future.set_exception(err)
+        else:
+            future.set_result(result)
+
+    def _run(self) -> None:
+        while (item := self._take((PRIORITY_STOP, PRIORITY_NORMAL), None)) is not None:
+            if item[0] is None:
+                break
+            self._execute(item)
+
+    def _pause(self, delay: float) -> None:
+        """Пауза клиента, которая прерывается для выполнения команд остановки."""
+
+        if (item := self._take((PRIORITY_STOP,), delay)) is not None:
+            self._execute(item)
+            while (item := self._take((PRIORITY_STOP,), 0.0)) is not None:
+                self._execute(item)
+
+    def submit(self, name: str, *args: Any, **kwargs: Any) -> Future[Any]:
+        """Постановка команды name клиента в очередь. Возвращает Future с
+        результатом команды.
+        """
+
+        if self._closed:
+            msg = "Worker is closed"
+            raise SmsdError(msg)
+
+        priority = PRIORITY_STOP if name in _STOPS else PRIORITY_NORMAL
+        future: Future[Any] = Future()
+        with self._ready:
+            self._lanes[priority].append((future, name, args, kwargs, priority, monotonic()))
+            self._ready.notify_all()
+        return future
+
+    def latency(self) -> LatencyStats:
+        """Статистика ожидания команд остановки в очереди."""
+
+        samples = sorted(self.stop_latency)
+        if not samples:
+            return LatencyStats(0, 0.0, 0.0, 0.0)
+        return LatencyStats(len(samples), sum(samples) / len(samples),
+                            samples[min(len(samples) * 99 // 100, len(samples) - 1)],
+                            samples[-1])
+
+    def call(self, name: str, *args: Any, **kwargs: Any) -> Any:
+        """Выполнение команды name и ожидание результата. В потоке
+        ввода-вывода команда выполняется сразу.
+        """
+
+        if get_ident() == self._thread.ident:
+            return getattr(self.client, name)(*args, **kwargs)
+        return self.submit(name, *args, **kwargs).result()
+
+    def close(self) -> None:
+        """Остановка потока после выполнения поставленных в очередь команд."""
+
+        if not self._closed:
+            self._closed = True
+            with self._ready:
+                self._lanes[PRIORITY_NORMAL].append((None,))
+                self._ready.notify_all()
+        if get_ident() != self._thread.ident:
+            self._thread.join()
+        self.client._pause = sleep
+
+    def __enter__(self) -> SmsdWorker:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None,
+                       exc_value: BaseException | None,
+                       traceback: TracebackType | None) -> None:
+        self.close()
+
+    def __getattr__(self, name: str) -> Any:
+        """Метод клиента, выполняемый в потоке ввода-вывода. Прочие
+        атрибуты читаются у клиента.
+        """
+
+        if name.startswith("_"):
+            raise AttributeError(name)
+        method = getattr(type(self.client), name, None)
+        if not callable(method):
+            return getattr(self.client, name)
+
+        def command(*args: Any, **kwargs: Any) -> Any:
+            return self.call(name, *args, **kwargs)
+
+        command.__name__ = name
+        command.__doc__ = method.__doc__
+        return command
+
+
+__all__ = ["PRIORITY_NORMAL", "PRIORITY_STOP", "LatencyStats", "SmsdWorker"]
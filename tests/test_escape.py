@@ -0,0 +1,46 @@
+#! /usr/bin/env python3
+
+"""Проверка замены специальных символов в пакетах интерфейса USB."""
+
+from random import Random
+
+import pytest
+
+from smsd.client import SmsdUsbClient
+from smsd.smsd import SmsdError
+
+SPECIAL = (0xFA, 0xFB, 0xFE, 0x7A, 0x7B, 0x7E)
+
+
+def random_frame(rng: Random, size: int) -> bytes:
+    """Случайный пакет с повышенной долей специальных символов."""
+
+    return bytes(rng.choice((*SPECIAL, rng.randrange(256))) for _ in range(size))
+
+
+def test_roundtrip_random() -> None:
+    rng = Random(0x5D5D)
+    for _ in range(2000):
+        frame = random_frame(rng, rng.randrange(1031))
+        assert SmsdUsbClient._unescape(SmsdUsbClient._escape(frame)) == frame
+
+
+@pytest.mark.parametrize("frame", [b"", b"\xFA", b"\xFB", b"\xFE", b"\xFE\x7A",
+                                   b"\xFE\x7E\x7B", b"\xFA\xFB\xFE" * 100])
+def test_roundtrip_special(frame: bytes) -> None:
+    escaped = SmsdUsbClient._escape(frame)
+
+    assert escaped[0] == 0xFA
+    assert escaped[-1] == 0xFB
+    assert b"\xFA" not in escaped[1:-1]
+    assert b"\xFB" not in escaped[1:-1]
+    assert SmsdUsbClient._unescape(escaped) == frame
+
+
+@pytest.mark.parametrize("escaped", [b"\xFA\xFE\xFB",           # FE в конце пакета
+                                     b"\xFA\xFE\x00\xFB",       # недопустимая пара
+                                     b"\xFA\x01\xFE\x7F\x02\xFB",
+                                     b"\xFA\xFE\xFE\x7A\xFB"])   # FE перед парой
+def test_unescape_invalid(escaped: bytes) -> None:
+    with pytest.raises(SmsdError, match="Invalid escape sequence"):
+        SmsdUsbClient._unescape(escaped)
@@ -0,0 +1,144 @@
+#! /usr/bin/env python3
+
+"""Проверка формирования и оптимизации программ управления."""
+
+import pytest
+
+from smsd.program import ProgramBuilder, estimate_time, optimize
+from smsd.protocol import COMMAND
+from smsd.smsd import SmsdError, command_word, split_command_word
+
+
+def test_build_resolves_labels() -> None:
+    builder = ProgramBuilder(bank=2)
+    builder.label("start")
+    builder.move_f(1000)
+    builder.set_wait(500)
+    builder.goto_program("start")
+    builder.call_program(1, 5)
+
+    assert list(builder.build()) == [
+        command_word(COMMAND.CMD_POWERSTEP01_MOVE_F, 1000),
+        command_word(COMMAND.CMD_POWERSTEP01_SET_WAIT, 500),
+        command_word(COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM, 2 << 8 | 0),
+        command_word(COMMAND.CMD_POWERSTEP01_CALL_PROGRAM, 1 << 8 | 5),
+    ]
+
+
+def test_build_label_errors() -> None:
+    builder = ProgramBuilder()
+    builder.label("start")
+    with pytest.raises(SmsdError, match="Duplicate label"):
+        builder.label("start")
+
+    builder.goto_program("missing")
+    with pytest.raises(SmsdError, match="Undefined label"):
+        builder.build()
+
+
+def test_build_value_range() -> None:
+    builder = ProgramBuilder()
+    with pytest.raises(SmsdError, match="out of 22-bit range"):
+        builder.move_f(1 << 22)
+    with pytest.raises(SmsdError, match="Command index 256 is out of range"):
+        builder.goto_program(0, 256)
+
+
+def test_build_limit_with_appended_end() -> None:
+    builder = ProgramBuilder()
+    for _ in range(255):
+        builder.move_f(1)
+    assert len(builder.to_bytes()) == 256 * 4
+
+    builder.move_f(1)
+    with pytest.raises(SmsdError, match="exceeds 256 commands"):
+        builder.build()
+
+
+def test_build_limit_with_explicit_end() -> None:
+    builder = ProgramBuilder()
+    for _ in range(255):
+        builder.move_f(1)
+    builder.end()
+    assert len(builder.to_bytes()) == 256 * 4
+
+    builder.end()
+    with pytest.raises(SmsdError, match="exceeds 256 commands"):
+        builder.build()
+
+
+def test_label_after_last_command() -> None:
+    builder = ProgramBuilder(bank=1)
+    builder.goto_program("after")
+    for _ in range(255):
+        builder.move_f(1)
+    builder.label("after")
+
+    with pytest.raises(SmsdError, match="out of program range"):
+        builder.resolve()
+
+
+def test_optimize_peephole() -> None:
+    builder = ProgramBuilder()
+    builder.set_max_speed(1000)
+    builder.set_max_speed(2000)
+    builder.move_f(100)
+    builder.move_f(200)
+    builder.set_wait(0)
+    builder.set_max_speed(2000)
+    builder.move_r(50)
+
+    report = builder.optimize()
+
+    assert builder.commands == [(COMMAND.CMD_POWERSTEP01_SET_MAX_SPEED, 2000),
+                                (COMMAND.CMD_POWERSTEP01_MOVE_F, 300),
+                                (COMMAND.CMD_POWERSTEP01_MOVE_R, 50)]
+    assert report.commands_before == 7
+    assert report.commands_after == 3
+    assert report.bytes_saved == 16
+    assert report.time_saved > 0
+
+
+def test_optimize_fold_loops() -> None:
+    builder = ProgramBuilder()
+    for _ in range(3):
+        builder.move_f(100)
+        builder.set_wait(10)
+
+    report = builder.optimize()
+
+    assert builder.commands == [(COMMAND.CMD_POWERSTEP01_MOVE_F, 100),
+                                (COMMAND.CMD_POWERSTEP01_SET_WAIT, 10),
+                                (COMMAND.CMD_POWERSTEP01_LOOP_PROGRAM, 2 << 10 | 2)]
+    assert report.bytes_saved == 12
+    # команда LOOP_PROGRAM выполняется на каждом повторе, поэтому свёртка
+    # уменьшает программу ценой небольшого увеличения времени выполнения
+    assert report.time_saved < 0
+    assert report.time_after == pytest.approx(estimate_time(builder.commands))
+
+
+def test_optimize_keeps_jump_targets() -> None:
+    builder = ProgramBuilder(bank=0)
+    builder.move_f(10)
+    builder.label("loop")
+    builder.move_f(20)
+    builder.move_f(30)
+    builder.goto_program("loop")
+    builder.goto_program(0, 3)
+
+    builder.optimize()
+
+    assert builder.labels == {"loop": 1}
+    assert [split_command_word(word) for word in builder.build()] == [
+        (COMMAND.CMD_POWERSTEP01_MOVE_F, 10),
+        (COMMAND.CMD_POWERSTEP01_MOVE_F, 50),
+        (COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM, 1),
+        (COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM, 2),
+    ]
+
+
+def test_optimize_jump_out_of_range() -> None:
+    commands = [(COMMAND.CMD_POWERSTEP01_GOTO_PROGRAM, 5)]
+
+    with pytest.raises(SmsdError, match="Jump target out of range"):
+        optimize(commands, {})  # type: ignore